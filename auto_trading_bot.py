@@ -1,5 +1,23 @@
+import argparse
 from controllers.controllers import TradeController
+from utils import instrumentation
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="現在値を取得して売買する（cron から1分ごとに実行）")
+    parser.add_argument('--instrument', nargs='?', const='', metavar='FILE',
+                        help="HTTP通信などの処理時間・件数を計測してJSONに保存する（FILE 省略時は logs/instrumentation/ に保存）")
+    parser.add_argument('--trace-memory', action='store_true', help="--instrument で tracemalloc によるメモリ使用量も記録する")
+    return parser.parse_args()
 
 if __name__ == "__main__":
+    args = parse_args()
+    if args.instrument is not None:
+        instrumentation.enable(trace_memory=args.trace_memory)
+
     controller = TradeController()
-    controller.day_trade()
+    with instrumentation.stage('day_trade'):
+        controller.day_trade()
+
+    if args.instrument is not None:
+        instrumentation.write_summary(args.instrument or instrumentation.default_summary_path('auto_trading_bot', 'logs/instrumentation'),
+                                      command='auto_trading_bot', symbol=controller.symbol)
@@ -1,10 +1,18 @@
 import os
-import datetime
+import sys
+import argparse
 import pandas as pd
 import logging
 
 from config.vars import ticker_symbol, initial_capital
 from controllers.controllers import TradeController
+from controllers.backtest_engine import run_backtest, run_crossover_backtest
+from models.models import TradeModel
+from models.results_store import save_run
+from models import intraday_store
+from views.views import setup_async_logging
+from utils import instrumentation
+from utils.instrumentation import timed, stage
 
 # ディレクトリの設定
 log_dir = "backtestlog"
@@ -13,25 +21,45 @@ if not os.path.exists(log_dir):
 
 # ログファイルの設定
 log_filename = os.path.join(log_dir, 'backtest_trade.log')
-logging.basicConfig(filename=log_filename, level=logging.INFO)
+setup_async_logging(log_filename)
 
 # 証券コード
 symbol = ticker_symbol
 
-# ディレクトリの設定
-output_dir = "stockdata"
-
-# ファイル名を作成
-stockdata_date_str = datetime.datetime.now().strftime('%Y%m%d')  # ファイル名に使われる日付
-csv_filename = os.path.join(output_dir, f'{ticker_symbol.replace(".", "_")}_one_month_intraday_stock_data_{stockdata_date_str}.csv')  # 特定の日付に対応
-
 # 過去の株価データを読み込む
-if os.path.exists(csv_filename):
-    df = pd.read_csv(csv_filename, index_col='Datetime', parse_dates=True)
-    logging.info(f"Loaded data from {csv_filename}")
-else:
-    logging.error(f"File {csv_filename} does not exist")
-    raise FileNotFoundError(f"File {csv_filename} does not exist")
+@timed('csv_load')
+def load_intraday_data(csv_filename):
+    if os.path.exists(csv_filename):
+        df = pd.read_csv(csv_filename, index_col='Datetime', parse_dates=True)
+        logging.info(f"Loaded data from {csv_filename}")
+        return df
+    else:
+        logging.error(f"File {csv_filename} does not exist")
+        raise FileNotFoundError(f"File {csv_filename} does not exist")
+
+# 複数ファイル（古い順）を連結し、重複する時刻は先に読んだ方を使う
+def load_intraday_files(csv_filenames):
+    if len(csv_filenames) == 1:
+        return load_intraday_data(csv_filenames[0])
+    df = pd.concat([load_intraday_data(filename) for filename in csv_filenames])
+    return df[~df.index.duplicated(keep='first')].sort_index()
+
+# 1分足データを chunksize 行ずつ読み込むジェネレータ（古い順に並んだファイルを続けて読む）
+def iter_intraday_chunks(csv_filenames, chunksize=100000):
+    last_timestamp = None
+    for filename in csv_filenames:
+        if not os.path.exists(filename):
+            logging.error(f"File {filename} does not exist")
+            raise FileNotFoundError(f"File {filename} does not exist")
+        for chunk in pd.read_csv(filename, index_col='Datetime', parse_dates=True, usecols=['Datetime', 'Close'], chunksize=chunksize):
+            # 前のファイルと重なる時刻は読み飛ばす
+            if last_timestamp is not None:
+                chunk = chunk[chunk.index > last_timestamp]
+            if chunk.empty:
+                continue
+            last_timestamp = chunk.index[-1]
+            yield chunk
+        logging.info(f"Streamed data from {filename}")
 
 # 取引関数の定義
 def buy_stock(price, quantity, capital, holding_quantity, average_purchase_price):
@@ -42,7 +70,7 @@ def buy_stock(price, quantity, capital, holding_quantity, average_purchase_price
         holding_quantity += quantity
         if holding_quantity > 0:
             average_purchase_price = ((average_purchase_price * (holding_quantity - quantity)) + (price * quantity)) / holding_quantity
-        logging.info(f"Bought {quantity} shares at {price} each. New capital: {capital}, Holding: {holding_quantity}")
+        logging.info("Bought %s shares at %s each. New capital: %s, Holding: %s", quantity, price, capital, holding_quantity)
     return capital, holding_quantity, average_purchase_price
 
 def sell_stock(price, quantity, capital, holding_quantity, average_purchase_price):
@@ -53,61 +81,175 @@ def sell_stock(price, quantity, capital, holding_quantity, average_purchase_pric
         holding_quantity -= quantity
         if holding_quantity == 0:
             average_purchase_price = 0
-        logging.info(f"Sold {quantity} shares at {price} each. New capital: {capital}, Holding: {holding_quantity}")
+        logging.info("Sold %s shares at %s each. New capital: %s, Holding: %s", quantity, price, capital, holding_quantity)
     return capital, holding_quantity, average_purchase_price
 
+@timed('backtest')
 def backtest(df, upper_limit, lower_limit):
     capital = initial_capital
     holding_quantity = 0
     average_purchase_price = 0
     trade_controller = TradeController()
+    # 1足ごとの状態は DEBUG（既定の INFO では整形もしない）
+    debug = logging.getLogger().isEnabledFor(logging.DEBUG)
 
     for index, row in df.iterrows():
         price = row['Close']
-        logging.info(f"Current price: {price}")
+        if debug:
+            logging.debug("Current price: %s", price)
 
-        action, quantity = trade_controller.trading_logic(price)
+        # コントローラにバックテストの状態を渡して判定させる
+        trade_controller.model.capital = capital
+        trade_controller.model.holding_quantity = holding_quantity
+        trade_controller.model.average_purchase_price = average_purchase_price
+        action, quantity = trade_controller.trading_logic(price, upper_limit, lower_limit)
 
         if action == 'buy':
-            logging.info(f"Buying {quantity} shares of {symbol}")
+            logging.info("Buying %s shares of %s", quantity, symbol)
             capital, holding_quantity, average_purchase_price = buy_stock(price, quantity, capital, holding_quantity, average_purchase_price)
         elif action == 'sell':
-            logging.info(f"Selling {quantity} shares of {symbol}")
+            logging.info("Selling %s shares of %s", quantity, symbol)
             capital, holding_quantity, average_purchase_price = sell_stock(price, quantity, capital, holding_quantity, average_purchase_price)
 
-        logging.info(f"Remaining capital: {capital}, Holding quantity: {holding_quantity}, Average purchase price: {average_purchase_price}")
+        if debug:
+            logging.debug("Remaining capital: %s, Holding quantity: %s, Average purchase price: %s", capital, holding_quantity, average_purchase_price)
 
     final_value = capital + holding_quantity * df.iloc[-1]['Close']
     profit_loss = final_value - initial_capital
     return final_value, profit_loss
 
+# backtest() と同じ売買ルールを NumPy で実行する（1足ごとのログは出さない）
+@timed('backtest')
+def vectorized_backtest(df, upper_limit, lower_limit):
+    model = TradeModel(initial_capital)
+    prices = df['Close'].to_numpy(dtype='float64')
+    run_backtest(prices, upper_limit, lower_limit, model)
+
+    final_value = model.capital + model.holding_quantity * df.iloc[-1]['Close']
+    profit_loss = final_value - initial_capital
+    return final_value, profit_loss
+
+# チャンクごとに全組み合わせの売買を進め、状態（TradeModel）を次のチャンクへ引き継ぐ
+def streaming_backtest(chunks, param_combinations):
+    models = [TradeModel(initial_capital) for _ in param_combinations]
+    last_close = None
+    chunks = iter(chunks)
+    while True:
+        with stage('csv_load'):  # ジェネレータの読み込み時間も計測する
+            chunk = next(chunks, None)
+        if chunk is None:
+            break
+        prices = chunk['Close'].to_numpy(dtype='float64')
+        with stage('backtest'):
+            for model, (upper_limit, lower_limit) in zip(models, param_combinations):
+                run_backtest(prices, upper_limit, lower_limit, model)
+        last_close = chunk.iloc[-1]['Close']
+
+    if last_close is None:
+        raise ValueError("No intraday data to backtest")
+    results = []
+    for model in models:
+        final_value = model.capital + model.holding_quantity * last_close
+        results.append((final_value, final_value - initial_capital))
+    return results
+
+# controllers2 の移動平均クロス＋ボラティリティ閾値の戦略をバックテストする
+@timed('crossover_backtest')
+def crossover_backtest(df):
+    model = TradeModel(initial_capital)
+    prices = df['Close'].to_numpy(dtype='float64')
+    run_crossover_backtest(prices, model)
+
+    final_value = model.capital + model.holding_quantity * df.iloc[-1]['Close']
+    profit_loss = final_value - initial_capital
+    return final_value, profit_loss
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="1分足データでupper_limit/lower_limitを総当たりでバックテストする")
+    parser.add_argument('--engine', choices=['vectorized', 'loop'], default='vectorized',
+                        help="vectorized: NumPy版（既定）, loop: 1足ずつ判定する従来版")
+    parser.add_argument('--crossover', action='store_true',
+                        help="controllers2 の移動平均クロス戦略も実行して結果を並べて表示する")
+    parser.add_argument('--csv', nargs='+',
+                        help="1分足CSV（複数指定する場合は古い順）。省略時は get_stock_month.py が日ごとに保存した直近 --days 日分")
+    parser.add_argument('--days', type=int, default=intraday_store.month_days, help="--csv 省略時に使う日数")
+    parser.add_argument('--interval', choices=list(intraday_store.aggregate_intervals),
+                        help="--csv 省略時に1分足の代わりに使う、取り込み時に作った集計足（5m, 1h, 1d）")
+    parser.add_argument('--stream', action='store_true',
+                        help="CSVを分割して読み込み、メモリ使用量を抑えてバックテストする")
+    parser.add_argument('--chunksize', type=int, default=100000, help="--stream で1回に読み込む行数")
+    parser.add_argument('--instrument', nargs='?', const='', metavar='FILE',
+                        help="段階ごとの処理時間・件数を計測してJSONに保存する（FILE 省略時は backtestlog/ に保存）")
+    parser.add_argument('--trace-memory', action='store_true', help="--instrument で tracemalloc によるメモリ使用量も記録する")
+    parser.add_argument('--log-level', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], default='INFO',
+                        help="ログレベル（DEBUG にすると1足ごとの状態も記録する）")
+    args = parser.parse_args()
+    if args.stream and (args.crossover or args.engine == 'loop'):
+        parser.error("--stream は vectorized エンジンの upper_limit/lower_limit 戦略のみ対応しています")
+    return args
+
+# 売買ルールを変えたら上げる（結果DBで実行を区別するのに使う）
+strategy_version = "intraday-threshold-v1"
+
+# パラメータの組み合わせ
+upper_limits = [1.01, 1.02, 1.03, 1.04, 1.05]
+lower_limits = [0.95, 0.96, 0.97, 0.98, 0.99]
+
 if __name__ == "__main__":
+    args = parse_args()
+    logging.getLogger().setLevel(args.log_level)
+    if args.instrument is not None:
+        instrumentation.enable(trace_memory=args.trace_memory)
+    csv_filenames = args.csv or intraday_store.partition_files(symbol, args.days, interval=args.interval)
+    if not csv_filenames:
+        logging.error("No intraday data stored for %s", symbol)
+        sys.exit(f"{intraday_store.symbol_dir(symbol)} に1分足がありません。先に get_stock_month.py を実行してください。")
+    param_combinations = [(ul, ll) for ul in upper_limits for ll in lower_limits]
+
+    if args.stream:
+        stream_results = streaming_backtest(iter_intraday_chunks(csv_filenames, args.chunksize), param_combinations)
+    else:
+        df = load_intraday_files(csv_filenames)
+        backtest_func = vectorized_backtest if args.engine == 'vectorized' else backtest
+
     best_upper_limit = None
     best_lower_limit = None
     best_profit_loss = float('-inf')
 
     results = []
 
-    for upper_limit in [1.01, 1.02, 1.03, 1.04, 1.05]:
-        for lower_limit in [0.95, 0.96, 0.97, 0.98, 0.99]:
-            logging.info(f"Testing upper_limit: {upper_limit}, lower_limit: {lower_limit}")
-            final_value, profit_loss = backtest(df, upper_limit, lower_limit)
-            results.append((upper_limit, lower_limit, final_value, profit_loss))
+    for i, (upper_limit, lower_limit) in enumerate(param_combinations):
+        logging.info("Testing upper_limit: %s, lower_limit: %s", upper_limit, lower_limit)
+        if args.stream:
+            final_value, profit_loss = stream_results[i]
+        else:
+            final_value, profit_loss = backtest_func(df, upper_limit, lower_limit)
+        results.append((upper_limit, lower_limit, final_value, profit_loss))
 
-            if profit_loss > best_profit_loss:
-                best_upper_limit = upper_limit
-                best_lower_limit = lower_limit
-                best_profit_loss = profit_loss
+        if profit_loss > best_profit_loss:
+            best_upper_limit = upper_limit
+            best_lower_limit = lower_limit
+            best_profit_loss = profit_loss
 
-            logging.info(f"Upper limit: {upper_limit}, Lower limit: {lower_limit}, Final value: {final_value}, Profit/Loss: {profit_loss}")
+        logging.info("Upper limit: %s, Lower limit: %s, Final value: %s, Profit/Loss: %s", upper_limit, lower_limit, final_value, profit_loss)
 
     print(f"Best upper limit: {best_upper_limit}")
     print(f"Best lower limit: {best_lower_limit}")
     print(f"Best Profit/Loss: {best_profit_loss}")
 
-    # 結果をCSVに保存
-    results_date_str = datetime.datetime.now().strftime('%Y%m%d%m')  # ファイル名に使われる日付
-    results_df = pd.DataFrame(results, columns=['upper_limit', 'lower_limit', 'final_value', 'profit_loss'])
-    results_filename = os.path.join(log_dir, f'{ticker_symbol.replace(".", "_")}_backtest_results_{results_date_str}.csv')
-    results_df.to_csv(results_filename, index=False)
-    logging.info(f"Backtest results saved to {results_filename}")
\ No newline at end of file
+    if args.crossover:
+        crossover_final_value, crossover_profit_loss = crossover_backtest(df)
+        print(f"MA crossover strategy Final value: {crossover_final_value}")
+        print(f"MA crossover strategy Profit/Loss: {crossover_profit_loss}")
+        logging.info(f"MA crossover strategy Final value: {crossover_final_value}, Profit/Loss: {crossover_profit_loss}")
+
+    # 結果を結果DBに追記
+    run_id = save_run(ticker_symbol, results, source='backtest:stream' if args.stream else f'backtest:{args.engine}',
+                      strategy_version=strategy_version, initial_capital=initial_capital)
+    logging.info("Backtest results saved to run %s", run_id)
+
+    if args.instrument is not None:
+        summary_filename = args.instrument or instrumentation.default_summary_path('backtest_trading_strategy', log_dir)
+        instrumentation.write_summary(summary_filename, command='backtest_trading_strategy', argv=sys.argv[1:],
+                                      engine='stream' if args.stream else args.engine, combinations=len(param_combinations))
+        print(f"Instrumentation summary saved to {summary_filename}")
\ No newline at end of file
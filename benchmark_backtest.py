@@ -0,0 +1,132 @@
+import os
+import json
+import argparse
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+from backtest_trading_strategy import (backtest, vectorized_backtest, crossover_backtest, load_intraday_data,
+                                       load_intraday_files, iter_intraday_chunks, streaming_backtest)
+from config.vars import initial_capital
+from controllers import controllers2
+
+from backtest_trading_strategy import upper_limits, lower_limits
+
+# 1ヶ月分の1分足に相当する合成データ（幾何ランダムウォーク）
+def make_synthetic_intraday(bars=7000, start_price=1500.0, seed=0):
+    rng = np.random.default_rng(seed)
+    close = np.round(start_price * np.exp(np.cumsum(rng.normal(0, 0.002, bars))), 1)
+    index = pd.date_range('2024-01-04 09:00', periods=bars, freq='min', name='Datetime')
+    return pd.DataFrame({'Close': close}, index=index)
+
+def time_sweep(backtest_func, df):
+    start = time.perf_counter()
+    results = [backtest_func(df, ul, ll) for ul in upper_limits for ll in lower_limits]
+    return time.perf_counter() - start, results
+
+# controllers2.TradeController.trading_logic を1足ずつ呼び、約定を model に反映する従来の方法
+def crossover_loop_backtest(df):
+    trade_controller = controllers2.TradeController()
+    model = trade_controller.model
+    for price in df['Close']:
+        action, quantity = trade_controller.trading_logic(price)
+        if action == 'buy':
+            model.capital -= quantity * price
+            model.holding_quantity += quantity
+            model.average_purchase_price = ((model.average_purchase_price * (model.holding_quantity - quantity)) + (price * quantity)) / model.holding_quantity
+        elif action == 'sell':
+            model.capital += quantity * price
+            model.holding_quantity -= quantity
+            if model.holding_quantity == 0:
+                model.average_purchase_price = 0
+    final_value = model.capital + model.holding_quantity * df.iloc[-1]['Close']
+    return final_value, final_value - initial_capital
+
+# 合成データを月ごとのCSVに分けて書き出し、一括読み込みと分割読み込みの結果・ピークメモリを比較する
+def stream_check(months, bars_per_month, chunksize):
+    param_combinations = [(ul, ll) for ul in upper_limits for ll in lower_limits]
+    df = make_synthetic_intraday(months * bars_per_month)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_filenames = []
+        for month in range(months):
+            filename = os.path.join(tmp_dir, f'month_{month:02d}.csv')
+            df.iloc[month * bars_per_month:(month + 1) * bars_per_month].to_csv(filename)
+            csv_filenames.append(filename)
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        full_df = load_intraday_files(csv_filenames)
+        in_memory_results = [vectorized_backtest(full_df, ul, ll) for ul, ll in param_combinations]
+        in_memory_time = time.perf_counter() - start
+        in_memory_peak = tracemalloc.get_traced_memory()[1]
+        del full_df
+        tracemalloc.reset_peak()
+
+        start = time.perf_counter()
+        stream_results = streaming_backtest(iter_intraday_chunks(csv_filenames, chunksize), param_combinations)
+        stream_time = time.perf_counter() - start
+        stream_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    if [tuple(map(float, r)) for r in in_memory_results] != [tuple(map(float, r)) for r in stream_results]:
+        raise AssertionError("Results differ between in-memory and streaming backtest")
+
+    print(f"Streaming check: {months} files x {bars_per_month} bars, chunksize {chunksize}")
+    print(f"In-memory: {in_memory_time:.3f} seconds, peak {in_memory_peak / 1e6:.1f} MB")
+    print(f"Streaming: {stream_time:.3f} seconds, peak {stream_peak / 1e6:.1f} MB")
+    print("Results match exactly.")
+
+def main():
+    parser = argparse.ArgumentParser(description="従来のループ版とNumPy版バックテストの速度と結果を比較する")
+    parser.add_argument('--csv', help="1分足CSV（省略時は合成データ）")
+    parser.add_argument('--bars', type=int, default=7000, help="合成データの足数")
+    parser.add_argument('--stream', action='store_true', help="分割読み込み版の比較だけを行う")
+    parser.add_argument('--months', type=int, default=12, help="--stream で生成する月数")
+    parser.add_argument('--chunksize', type=int, default=20000, help="--stream で1回に読み込む行数")
+    parser.add_argument('--json', help="計測結果を書き出すJSONファイル（ref/benchmark_suite.py から使う）")
+    args = parser.parse_args()
+
+    if args.stream:
+        stream_check(args.months, args.bars, args.chunksize)
+        return
+
+    df = load_intraday_data(args.csv) if args.csv else make_synthetic_intraday(args.bars)
+
+    loop_time, loop_results = time_sweep(backtest, df)
+    vec_time, vec_results = time_sweep(vectorized_backtest, df)
+
+    mismatches = [(a, b) for a, b in zip(loop_results, vec_results) if a != b]
+    if mismatches:
+        raise AssertionError(f"Results differ between loop and vectorized backtest: {mismatches[:3]}")
+
+    combos = len(upper_limits) * len(lower_limits)
+    print(f"Bars: {len(df)}, Parameter combinations: {combos}")
+    print(f"Loop:       {loop_time:.3f} seconds")
+    print(f"Vectorized: {vec_time:.3f} seconds")
+    print(f"Speedup:    {loop_time / vec_time:.1f}x")
+    print("Results match exactly.")
+
+    start = time.perf_counter()
+    crossover_loop_result = crossover_loop_backtest(df)
+    crossover_loop_time = time.perf_counter() - start
+    start = time.perf_counter()
+    crossover_result = crossover_backtest(df)
+    crossover_time = time.perf_counter() - start
+    if not np.allclose(crossover_loop_result, crossover_result, rtol=1e-12):
+        raise AssertionError(f"MA crossover results differ: {crossover_loop_result} vs {crossover_result}")
+
+    print(f"MA crossover loop:       {crossover_loop_time:.3f} seconds")
+    print(f"MA crossover vectorized: {crossover_time:.3f} seconds")
+    print(f"Speedup:    {crossover_loop_time / crossover_time:.1f}x")
+    print(f"MA crossover Profit/Loss: {crossover_result[1]:.1f} (threshold best: {max(r[1] for r in vec_results):.1f})")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'bars': len(df), 'combinations': combos,
+                       'loop_seconds': loop_time, 'vectorized_seconds': vec_time,
+                       'crossover_loop_seconds': crossover_loop_time, 'crossover_vectorized_seconds': crossover_time}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
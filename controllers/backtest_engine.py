@@ -0,0 +1,132 @@
+# stocktrading/controllers/backtest_engine.py
+
+import numpy as np
+import pandas as pd
+from utils.instrumentation import timed
+
+# 条件に一致する足を探すときの初期ブロック長（見つからなければ倍々に広げる）
+SEARCH_BLOCK = 256
+
+
+def find_first(n, start, predicate, block=SEARCH_BLOCK):
+    # start 以降で predicate(slice) の結果が True になる最初の位置を返す（なければ n）
+    while start < n:
+        stop = min(start + block, n)
+        hits = np.flatnonzero(predicate(slice(start, stop)))
+        if hits.size:
+            return start + int(hits[0])
+        start = stop
+        block *= 2
+    return n
+
+
+def run_backtest(prices, upper_limit, lower_limit, model):
+    """TradeController.trading_logic と同じ売買ルールを終値の配列に対して実行する。
+
+    1足ずつ判定する代わりに、次に売買が起きる足を NumPy で探して飛ばす。
+    model（TradeModel）の状態を更新し、約定回数を返す。
+    """
+    prices = np.asarray(prices, dtype=np.float64)
+    n = len(prices)
+    trades = 0
+    i = 0
+
+    while i < n:
+        if model.holding_quantity == 0:
+            # ルール3: capitalの金額以内で買える最初の足
+            capital = model.capital
+            i = find_first(n, i, lambda s: prices[s] <= capital)
+            if i >= n:
+                break
+            price = prices[i]
+            quantity = int(model.capital / price)
+            if quantity * price > model.capital:
+                quantity = model.capital // price  # 買えるだけ買う
+            if quantity > 0:
+                model.capital -= quantity * price
+                model.holding_quantity += quantity
+                model.average_purchase_price = (
+                    (model.average_purchase_price * (model.holding_quantity - quantity)) + (price * quantity)
+                ) / model.holding_quantity
+                trades += 1
+        else:
+            # ルール1・2: upper_limit 以上または lower_limit 以下になった最初の足で全株売る
+            upper = model.average_purchase_price * upper_limit
+            lower = model.average_purchase_price * lower_limit
+            i = find_first(n, i, lambda s: (prices[s] >= upper) | (prices[s] <= lower))
+            if i >= n:
+                break
+            price = prices[i]
+            model.capital += model.holding_quantity * price
+            model.holding_quantity = 0
+            model.average_purchase_price = 0
+            trades += 1
+        i += 1
+
+    return trades
+
+
+@timed('indicators')
+def crossover_indicators(prices, short_window=10, long_window=50, volatility_window=20):
+    # controllers2 の calculate_moving_averages / calculate_volatility を全期間まとめて計算する
+    prices = pd.Series(prices, dtype='float64')
+    short_ma = prices.rolling(window=short_window).mean().to_numpy()
+    long_ma = prices.rolling(window=long_window).mean().to_numpy()
+    volatility = prices.pct_change().rolling(window=volatility_window).std().to_numpy(copy=True)
+    volatility[:volatility_window - 1] = 0.01  # 履歴が足りない間の仮のボラティリティ
+    return short_ma, long_ma, volatility
+
+
+def run_crossover_backtest(prices, model, short_window=10, long_window=50, volatility_window=20):
+    """controllers2 の移動平均クロス＋ボラティリティ閾値の戦略を終値の配列に対して実行する。
+
+    指標は rolling でまとめて計算し、売買が起きる足だけを順に処理する。
+    model（TradeModel）の状態を更新し、約定回数を返す。
+    """
+    prices = np.asarray(prices, dtype=np.float64)
+    short_ma, long_ma, volatility = crossover_indicators(prices, short_window, long_window, volatility_window)
+    golden_cross = short_ma > long_ma
+    dead_cross = short_ma < long_ma
+    band = volatility * 0.1
+    n = len(prices)
+    trades = 0
+    i = 0
+
+    while i < n:
+        if model.holding_quantity == 0:
+            # 短期移動平均が長期移動平均を上回り、capitalの金額以内で買える最初の足
+            capital = model.capital
+            i = find_first(n, i, lambda s: golden_cross[s] & (prices[s] <= capital))
+            if i >= n:
+                break
+            price = prices[i]
+            quantity = int(model.capital / price)
+            if quantity > 0:
+                model.capital -= quantity * price
+                model.holding_quantity += quantity
+                model.average_purchase_price = (
+                    (model.average_purchase_price * (model.holding_quantity - quantity)) + (price * quantity)
+                ) / model.holding_quantity
+                trades += 1
+        else:
+            # 動的な閾値に達したら半分、短期移動平均が長期移動平均を下回ったら全株売る
+            average_price = model.average_purchase_price
+            i = find_first(n, i, lambda s: dead_cross[s]
+                           | (prices[s] >= average_price * (1 + band[s]))
+                           | (prices[s] <= average_price * (1 - band[s])))
+            if i >= n:
+                break
+            price = prices[i]
+            if price >= average_price * (1 + band[i]) or price <= average_price * (1 - band[i]):
+                quantity = model.holding_quantity // 2
+            else:
+                quantity = model.holding_quantity
+            if quantity > 0:
+                model.capital += quantity * price
+                model.holding_quantity -= quantity
+                if model.holding_quantity == 0:
+                    model.average_purchase_price = 0
+                trades += 1
+        i += 1
+
+    return trades
@@ -6,6 +6,7 @@ import numpy as np
 from models.models import TradeModel
 from views.views import Logger
 from config.vars import ticker_symbol, base_url, upper_limit, lower_limit, initial_capital, api_key
+from utils.instrumentation import stage, count
 import os
 
 class TradeController:
@@ -18,7 +19,9 @@ class TradeController:
         try:
             url = f"{base_url}/v1/marketdata/quote?symbol={self.symbol}"
             headers = {"x-api-key": api_key}
-            response = requests.get(url, headers=headers)
+            with stage('http'):
+                count('http_requests')
+                response = requests.get(url, headers=headers)
             response.raise_for_status()
             data = response.json()
             return data["lastPrice"]
@@ -40,7 +43,9 @@ class TradeController:
             "timeInForce": "day"
         }
         try:
-            response = requests.post(url, headers=headers, json=order_data)
+            with stage('http'):
+                count('http_requests')
+                response = requests.post(url, headers=headers, json=order_data)
             response.raise_for_status()
             self.model.capital -= quantity * price
             self.model.holding_quantity += quantity
@@ -65,7 +70,9 @@ class TradeController:
             "timeInForce": "day"
         }
         try:
-            response = requests.post(url, headers=headers, json=order_data)
+            with stage('http'):
+                count('http_requests')
+                response = requests.post(url, headers=headers, json=order_data)
             response.raise_for_status()
             self.model.capital += quantity * price
             self.model.holding_quantity -= quantity
@@ -75,7 +82,7 @@ class TradeController:
         except requests.RequestException as e:
             self.logger.error(f"Error selling stock: {e}")
 
-    def trading_logic(self, price):
+    def trading_logic(self, price, upper_limit=upper_limit, lower_limit=lower_limit):
         action = None
         quantity = 0
 
@@ -0,0 +1,140 @@
+'''intraday_store.py'''
+import os
+import time
+import datetime
+import logging
+import pandas as pd
+
+# 1分足を銘柄ごと・日ごとのCSV（stockdata/intraday/<銘柄>/<YYYY-MM-DD>.csv）に保存し、足りない日だけダウンロードする。
+# データのない平日（祝日）は <YYYY-MM-DD>.empty を置いて次回は取得しない
+store_dir = os.path.join("stockdata", "intraday")
+columns = ['Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume']
+# yfinance の1分足は直近30日まで、1回のリクエストは8日まで
+max_lookback_days = 29
+max_request_days = 7
+# バックテストが使う期間（約1ヶ月）
+month_days = 30
+# 連続してリクエストするときの待ち時間（秒）
+request_interval = 2
+# 1分足の日ごとのファイルを保存するときに一緒に作る集計足（<銘柄>/<間隔>/<YYYY-MM-DD>.csv）
+aggregate_intervals = {'5m': '5min', '1h': '1h', '1d': '1D'}
+aggregations = {'Open': 'first', 'High': 'max', 'Low': 'min', 'Close': 'last', 'Adj Close': 'last', 'Volume': 'sum'}
+
+def symbol_dir(symbol):
+    return os.path.join(store_dir, symbol.replace(".", "_"))
+
+def partition_path(symbol, day, suffix='.csv', interval=None):
+    directory = os.path.join(symbol_dir(symbol), interval) if interval else symbol_dir(symbol)
+    return os.path.join(directory, f"{day.isoformat()}{suffix}")
+
+def stored_days(symbol, suffixes=('.csv', '.empty'), interval=None):
+    directory = os.path.join(symbol_dir(symbol), interval) if interval else symbol_dir(symbol)
+    if not os.path.isdir(directory):
+        return set()
+    return {datetime.date.fromisoformat(os.path.splitext(name)[0]) for name in os.listdir(directory) if os.path.splitext(name)[1] in suffixes}
+
+def trading_days(start, end):
+    # start から end の前日までの平日
+    return [day.date() for day in pd.bdate_range(start, end - datetime.timedelta(days=1))]
+
+def missing_days(symbol, today=None, lookback_days=max_lookback_days):
+    """直近 lookback_days 日（当日は取引中なので除く）のうち、まだ保存していない平日。"""
+    today = today or datetime.date.today()
+    stored = stored_days(symbol)
+    return [day for day in trading_days(today - datetime.timedelta(days=lookback_days), today) if day not in stored]
+
+def day_ranges(days):
+    # 連続した平日を max_request_days 日以内の (開始日, 終了日の翌日) にまとめる
+    ranges = []
+    for day in days:
+        if ranges and (day - ranges[-1][0]).days < max_request_days and len(trading_days(ranges[-1][1], day)) == 0:
+            ranges[-1][1] = day + datetime.timedelta(days=1)
+        else:
+            ranges.append([day, day + datetime.timedelta(days=1)])
+    return [tuple(r) for r in ranges]
+
+def _write_csv(filename, df):
+    # 途中で止まっても壊れたファイルが残らないように一時ファイルに書いてから置き換える
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    df.to_csv(filename + '.tmp', index_label='Datetime')
+    os.replace(filename + '.tmp', filename)
+
+def aggregate(df, interval):
+    # 1分足を interval の足にまとめる（足の時刻は期間の始まり。取引のない時間帯の足は作らない）
+    bars = df.resample(aggregate_intervals[interval], label='left', closed='left').agg(aggregations)
+    return bars.dropna(subset=['Close'])
+
+def write_aggregates(symbol, day, df):
+    for interval in aggregate_intervals:
+        _write_csv(partition_path(symbol, day, interval=interval), aggregate(df, interval))
+
+def write_partition(symbol, day, df):
+    os.makedirs(symbol_dir(symbol), exist_ok=True)
+    if df.empty:
+        open(partition_path(symbol, day, '.empty'), 'w').close()
+        return
+    # 集計足を先に書き、1分足のファイルを最後に置く（1分足があれば集計足もそろっている）
+    write_aggregates(symbol, day, df)
+    _write_csv(partition_path(symbol, day), df)
+
+def rebuild_aggregates(symbol):
+    """集計足がない日（aggregate_intervals を増やした場合など）だけ、保存済みの1分足から集計足を作る。作った日数を返す。"""
+    aggregated = [stored_days(symbol, ('.csv',), interval) for interval in aggregate_intervals]
+    missing = sorted(day for day in stored_days(symbol, ('.csv',)) if any(day not in days for days in aggregated))
+    for day in missing:
+        write_aggregates(symbol, day, pd.read_csv(partition_path(symbol, day), index_col='Datetime', parse_dates=True))
+    return len(missing)
+
+def _download(source, symbol, start, end):
+    data = source.download(symbol, start=start.isoformat(), end=end.isoformat(), interval="1m", auto_adjust=False, progress=False)
+    if data is None or data.empty:
+        return pd.DataFrame(columns=columns)
+    if isinstance(data.columns, pd.MultiIndex):
+        data.columns = data.columns.get_level_values(0)  # 新しい yfinance は1銘柄でも (項目, 銘柄) の列になる
+    if 'Adj Close' not in data.columns:
+        data['Adj Close'] = data['Close']
+    return data[columns].sort_index()
+
+def update(symbol, today=None, lookback_days=max_lookback_days, source=None):
+    """保存していない日の1分足だけをダウンロードして日ごとに保存し、保存した日のリストを返す。
+
+    データのない平日（祝日）も .empty を保存して、次回は取得しない。ただし yf.download は失敗しても空のデータを返すので、
+    期間全体が空のときは失敗として扱い何も保存しない（期間内の他の日にデータがあるときだけ .empty を置く）。
+    """
+    if source is None:
+        import yfinance as source
+    days = missing_days(symbol, today, lookback_days)
+    saved = []
+    for i, (start, end) in enumerate(day_ranges(days)):
+        if i > 0:
+            time.sleep(request_interval)  # API制限を避けるために待機
+        try:
+            data = _download(source, symbol, start, end)
+        except Exception as e:
+            logging.error(f"Error downloading data for {symbol} from {start} to {end}: {e}")
+            continue
+        if data.empty:
+            logging.warning(f"No data returned for {symbol} from {start} to {end}; will retry on the next run")
+            continue
+        by_day = {day: group for day, group in data.groupby(data.index.date)}
+        for day in trading_days(start, end):
+            write_partition(symbol, day, by_day.get(day, data.iloc[0:0]))
+            saved.append(day)
+        logging.info(f"Stored {len(data)} bars of {symbol} from {start} to {end}")
+    rebuilt = rebuild_aggregates(symbol)
+    if rebuilt:
+        logging.info(f"Built aggregated bars of {symbol} for {rebuilt} stored days")
+    return saved
+
+def partition_files(symbol, days=month_days, today=None, interval=None):
+    """直近 days 日の保存済みの日ごとのファイル（古い順）。interval を指定すると集計足のファイル。"""
+    today = today or datetime.date.today()
+    start = today - datetime.timedelta(days=days)
+    return [partition_path(symbol, day, interval=interval) for day in sorted(stored_days(symbol, ('.csv',), interval)) if start <= day < today]
+
+def load_month(symbol, days=month_days, today=None, interval=None):
+    """直近 days 日の1分足（interval を指定すると集計足）を保存済みのファイルから組み立てる（ダウンロードはしない）。"""
+    filenames = partition_files(symbol, days, today, interval)
+    if not filenames:
+        raise FileNotFoundError(f"No intraday data stored for {symbol} in {symbol_dir(symbol)}")
+    return pd.concat([pd.read_csv(filename, index_col='Datetime', parse_dates=True) for filename in filenames]).sort_index()
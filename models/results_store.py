@@ -0,0 +1,116 @@
+'''results_store.py'''
+import os
+import datetime
+import pandas as pd
+from sqlalchemy import create_engine, text
+from utils.instrumentation import timed
+
+# バックテスト結果の保存先（実行ごとのCSVの代わりに1つのDBに追記する）
+results_db_filename = 'backtest_results.db'
+results_db_path = os.path.join(os.getcwd(), results_db_filename)
+results_engine = create_engine(f'sqlite:///{results_db_path}', connect_args={'timeout': 30})
+
+_tables_ready = False
+
+def _ensure_tables(conn):
+    global _tables_ready
+    if _tables_ready:
+        return
+    # 実行ごとの情報と最良値（backtest_runs）と、組み合わせごとの結果（backtest_results）
+    conn.execute(text("""
+    CREATE TABLE IF NOT EXISTS backtest_runs (
+        run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        ticker TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        source TEXT NOT NULL,
+        data_hash TEXT,
+        strategy_version TEXT,
+        initial_capital REAL,
+        combinations INTEGER,
+        best_upper_limit REAL,
+        best_lower_limit REAL,
+        best_profit_loss REAL
+    )
+    """))
+    conn.execute(text("""
+    CREATE TABLE IF NOT EXISTS backtest_results (
+        run_id INTEGER NOT NULL,
+        upper_limit REAL NOT NULL,
+        lower_limit REAL NOT NULL,
+        final_value REAL,
+        profit_loss REAL,
+        PRIMARY KEY (run_id, upper_limit, lower_limit)
+    ) WITHOUT ROWID
+    """))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_backtest_runs_ticker ON backtest_runs (ticker, run_id)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_backtest_runs_created_at ON backtest_runs (created_at)"))
+    _tables_ready = True
+
+@timed('results_store')
+def save_run(ticker, results, source='optimizer', data_hash=None, strategy_version=None, initial_capital=None):
+    """1回分のグリッド結果 [(upper_limit, lower_limit, final_value, profit_loss), ...] を追記し、run_id を返す。"""
+    best = max(results, key=lambda r: r[3]) if results else (None, None, None, None)
+    with results_engine.begin() as conn:
+        _ensure_tables(conn)
+        run_id = conn.execute(text("""
+        INSERT INTO backtest_runs (ticker, created_at, source, data_hash, strategy_version, initial_capital, combinations,
+                                   best_upper_limit, best_lower_limit, best_profit_loss)
+        VALUES (:ticker, :created_at, :source, :data_hash, :strategy_version, :initial_capital, :combinations,
+                :best_upper_limit, :best_lower_limit, :best_profit_loss)
+        """), {'ticker': ticker, 'created_at': datetime.datetime.now().isoformat(timespec='seconds'), 'source': source,
+               'data_hash': data_hash, 'strategy_version': strategy_version, 'initial_capital': initial_capital,
+               'combinations': len(results), 'best_upper_limit': best[0], 'best_lower_limit': best[1],
+               'best_profit_loss': best[3]}).lastrowid
+        if results:
+            conn.execute(text("""
+            INSERT OR REPLACE INTO backtest_results (run_id, upper_limit, lower_limit, final_value, profit_loss)
+            VALUES (:run_id, :upper_limit, :lower_limit, :final_value, :profit_loss)
+            """), [{'run_id': run_id, 'upper_limit': float(ul), 'lower_limit': float(ll), 'final_value': float(fv), 'profit_loss': float(pl)}
+                   for ul, ll, fv, pl in results])
+    return run_id
+
+def recent_runs(ticker, limit=10, source=None):
+    """銘柄の直近 limit 回の実行（新しい順）。"""
+    with results_engine.begin() as conn:
+        _ensure_tables(conn)
+        rows = conn.execute(text("""
+        SELECT run_id, ticker, created_at, source, data_hash, strategy_version, initial_capital, combinations,
+               best_upper_limit, best_lower_limit, best_profit_loss
+        FROM backtest_runs WHERE ticker=:ticker AND (:source IS NULL OR source=:source)
+        ORDER BY run_id DESC LIMIT :limit
+        """), {'ticker': ticker, 'source': source, 'limit': limit})
+        return pd.DataFrame(rows.fetchall(), columns=list(rows.keys()))
+
+def best_params(ticker, last_runs=10, top=5, source=None):
+    """直近 last_runs 回の実行で平均損益が大きい (upper_limit, lower_limit) を top 件返す。
+
+    索引 (ticker, run_id) で対象の実行だけを取り出し、その結果だけを集計する（全件は読まない）。
+    """
+    with results_engine.begin() as conn:
+        _ensure_tables(conn)
+        rows = conn.execute(text("""
+        WITH runs AS (
+            SELECT run_id FROM backtest_runs WHERE ticker=:ticker AND (:source IS NULL OR source=:source)
+            ORDER BY run_id DESC LIMIT :last_runs
+        )
+        SELECT r.upper_limit, r.lower_limit, AVG(r.profit_loss) AS mean_profit_loss, MIN(r.profit_loss) AS min_profit_loss,
+               MAX(r.profit_loss) AS max_profit_loss, COUNT(*) AS runs
+        FROM backtest_results r JOIN runs USING (run_id)
+        GROUP BY r.upper_limit, r.lower_limit
+        ORDER BY mean_profit_loss DESC, r.upper_limit, r.lower_limit
+        LIMIT :top
+        """), {'ticker': ticker, 'source': source, 'last_runs': last_runs, 'top': top})
+        return pd.DataFrame(rows.fetchall(), columns=list(rows.keys()))
+
+def load_run_results(run_id):
+    with results_engine.begin() as conn:
+        _ensure_tables(conn)
+        rows = conn.execute(text("""
+        SELECT upper_limit, lower_limit, final_value, profit_loss FROM backtest_results WHERE run_id=:run_id
+        ORDER BY upper_limit, lower_limit
+        """), {'run_id': run_id})
+        return pd.DataFrame(rows.fetchall(), columns=list(rows.keys()))
+
+# プロセスプールのワーカー起動時に呼び、fork元の接続を使わずワーカーごとに接続を開き直す
+def dispose_results_engine():
+    results_engine.dispose(close=False)
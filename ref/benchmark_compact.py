@@ -0,0 +1,63 @@
+import argparse
+import datetime
+import time
+import numpy as np
+import pandas as pd
+from benchmark_suite import make_synthetic_ohlcv, synthetic_tickers
+from controllers.grid_backtest import run_grid_backtest
+from config.vars import upper_limits, lower_limits, initial_capital
+from utils.compact import CompactPanel
+
+def synthetic_panel(tickers, days):
+    # load_stock_data_many() と同じ (ticker, date) の MultiIndex の DataFrame
+    index = pd.bdate_range(end=datetime.date.today(), periods=days, name='date').astype('datetime64[us]')
+    frames = [make_synthetic_ohlcv(index, seed=k, volatility=0.03) for k in range(len(tickers))]
+    return pd.concat(frames, keys=tickers, names=['ticker', 'date'])
+
+def megabytes(n):
+    return f"{n / 1024 / 1024:>9.1f} MB"
+
+def backtest_all(tickers, get_prices):
+    results = []
+    start = time.perf_counter()
+    for ticker in tickers:
+        final_values, _, _ = run_grid_backtest(get_prices(ticker), upper_limits, lower_limits, initial_capital, True)
+        results.append(final_values)
+    return time.perf_counter() - start, np.concatenate(results)
+
+def main():
+    parser = argparse.ArgumentParser(description="日足パネルのメモリ使用量と、グリッドバックテストのループの速度を float64 の DataFrame と CompactPanel で比較する")
+    parser.add_argument('--tickers', type=int, default=4000, help="銘柄数")
+    parser.add_argument('--days', type=int, default=750, help="1銘柄あたりの日数")
+    parser.add_argument('--backtest-tickers', type=int, default=200, help="バックテストする銘柄数")
+    args = parser.parse_args()
+
+    tickers = synthetic_tickers(args.tickers)
+    panel_df = synthetic_panel(tickers, args.days)
+    long_df = panel_df.reset_index()  # 銘柄が object の列になる形（read_sql などで読んだ場合）
+    categorical_df = long_df.astype({'ticker': 'category'})
+    start = time.perf_counter()
+    panel = CompactPanel.from_frame(panel_df)
+    build_time = time.perf_counter() - start
+    lossy_df = panel_df.assign(adj_close=panel_df['adj_close'] * 0.98765)  # 0.1円単位でない調整後終値
+    lossy = CompactPanel.from_frame(lossy_df, lossy=True)
+
+    print(f"Rows: {len(panel_df):,} ({args.tickers} tickers x {args.days} days)")
+    print(f"{'long DataFrame (object ticker)':<44}{megabytes(long_df.memory_usage(deep=True).sum())}")
+    print(f"{'long DataFrame (categorical ticker)':<44}{megabytes(categorical_df.memory_usage(deep=True).sum())}")
+    print(f"{'(ticker, date) MultiIndex DataFrame':<44}{megabytes(panel_df.memory_usage(deep=True).sum())}")
+    print(f"{'CompactPanel (int32 prices, int32 volume)':<44}{megabytes(panel.nbytes)}  built in {build_time:.2f} s")
+    print(f"{'CompactPanel (float32 adj_close, lossy)':<44}{megabytes(lossy.nbytes)}")
+    print(f"Column dtypes: {', '.join(f'{name}={values.dtype}' for name, values in panel.columns.items())}, dates={panel.dates.dtype}")
+
+    selected = tickers[:args.backtest_tickers]
+    frame_time, frame_results = backtest_all(selected, lambda ticker: panel_df.loc[ticker]['close'].to_numpy())
+    compact_time, compact_results = backtest_all(selected, panel.close)
+    float32_time, float32_results = backtest_all(selected, lambda ticker: panel.close(ticker).astype(np.float32))
+    print(f"Grid backtest of {len(selected)} tickers x {len(upper_limits) * len(lower_limits)} combinations:")
+    print(f"  prices from DataFrame (.loc)       {frame_time:.3f} s")
+    print(f"  prices from CompactPanel (int32)   {compact_time:.3f} s  identical results: {np.array_equal(frame_results, compact_results)}")
+    print(f"  prices as float32                  {float32_time:.3f} s  differing results: {int((float32_results != frame_results).sum())} of {len(frame_results)}")
+
+if __name__ == "__main__":
+    main()
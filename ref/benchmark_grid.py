@@ -0,0 +1,52 @@
+import argparse
+import logging
+import time
+import numpy as np
+import pandas as pd
+from config.vars import upper_limits, lower_limits, initial_capital
+from controllers.optimal_parameter_finder import optimize_parameters
+from controllers.trade import TradeController
+from controllers.grid_backtest import moving_average_signal, run_grid_backtest
+
+# 日足の合成データ（幾何ランダムウォーク）
+def make_synthetic_daily(days=30, start_price=400.0, seed=0):
+    rng = np.random.default_rng(seed)
+    close = np.round(start_price * np.exp(np.cumsum(rng.normal(0, 0.03, days))), 1)
+    index = pd.date_range('2024-01-04', periods=days, freq='D', name='date')
+    return pd.DataFrame({'open': close, 'high': close, 'low': close, 'close': close, 'adj_close': close, 'volume': 1000}, index=index)
+
+def main():
+    parser = argparse.ArgumentParser(description="組み合わせごとのループとグリッド一括計算の速度と結果を比較する")
+    parser.add_argument('--days', type=int, default=30, help="合成データの日数")
+    parser.add_argument('--seeds', type=int, default=5, help="比較する合成データの本数")
+    args = parser.parse_args()
+    logging.disable(logging.ERROR)  # ループ版のログ出力は計測から外す
+
+    param_combinations = [(ul, ll) for ul in upper_limits for ll in lower_limits]
+    loop_time = grid_time = 0.0
+
+    for seed in range(args.seeds):
+        df = make_synthetic_daily(args.days, seed=seed)
+
+        start = time.perf_counter()
+        loop_results = [optimize_parameters(df, ul, ll, "SYNTH", initial_capital) for ul, ll in param_combinations]
+        loop_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        ma_signal = moving_average_signal(TradeController(df, "SYNTH", initial_capital))
+        final_values, profit_losses, _ = run_grid_backtest(df['close'].to_numpy(), upper_limits, lower_limits, initial_capital, ma_signal)
+        grid_time += time.perf_counter() - start
+
+        grid_results = list(zip(final_values.tolist(), profit_losses.tolist()))
+        loop_results = [(float(r[0]), float(r[1])) for r in loop_results]
+        if loop_results != grid_results:
+            raise AssertionError(f"Results differ between loop and grid backtest for seed {seed}")
+
+    print(f"Days: {args.days}, Parameter combinations: {len(param_combinations)}, Seeds: {args.seeds}")
+    print(f"Loop: {loop_time:.3f} seconds")
+    print(f"Grid: {grid_time:.3f} seconds")
+    print(f"Speedup: {loop_time / grid_time:.1f}x")
+    print("Results match exactly.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import argparse
+import logging
+import time
+import numpy as np
+from config.vars import short_term_window, long_term_window
+from utils.indicators import MovingAverages
+
+# 従来の trading_logic と同じく np.convolve で移動平均の配列全体を計算する
+def convolve_moving_average(prices, window):
+    return np.convolve(prices, np.ones(window), 'valid') / window
+
+def main():
+    parser = argparse.ArgumentParser(description="np.convolve による移動平均と累積和による移動平均の結果と速度を比較する")
+    parser.add_argument('--points', type=int, default=5000, help="価格データの本数")
+    args = parser.parse_args()
+    logging.disable(logging.ERROR)
+
+    rng = np.random.default_rng(0)
+    prices = np.round(400.0 * np.exp(np.cumsum(rng.normal(0, 0.03, args.points))), 1).tolist()
+
+    # 1本ずつ追加したときの値を、配列全体から計算した値と照合する
+    start = time.perf_counter()
+    moving_averages = MovingAverages(short_term_window, long_term_window)
+    short_values, long_values = [], []
+    for price in prices:
+        moving_averages.update(price)
+        short_values.append(moving_averages.short.value)
+        long_values.append(moving_averages.long.value)
+    incremental_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(long_term_window, len(prices) + 1):
+        history = prices[:i]
+        convolve_moving_average(history, short_term_window)
+        convolve_moving_average(history, long_term_window)
+    convolve_time = time.perf_counter() - start
+
+    expected_short = convolve_moving_average(prices, short_term_window)
+    expected_long = convolve_moving_average(prices, long_term_window)
+    actual_short = np.array(short_values[short_term_window - 1:])
+    actual_long = np.array(long_values[long_term_window - 1:])
+
+    short_diff = np.max(np.abs(actual_short - expected_short))
+    long_diff = np.max(np.abs(actual_long - expected_long))
+    if not (np.allclose(actual_short, expected_short, rtol=1e-12, atol=0) and np.allclose(actual_long, expected_long, rtol=1e-12, atol=0)):
+        raise AssertionError(f"Moving averages differ: short {short_diff}, long {long_diff}")
+
+    # 短期MA > 長期MA の判定が食い違うのは、両者が丸め誤差の範囲で等しい足だけであることを確認する
+    offset = long_term_window - short_term_window
+    flipped = (actual_short[offset:] > actual_long) != (expected_short[offset:] > expected_long)
+    ties = np.isclose(expected_short[offset:], expected_long, rtol=1e-12, atol=0)
+    if np.any(flipped & ~ties):
+        raise AssertionError("Crossover signal differs away from a tie")
+
+    print(f"Points: {len(prices)}, Windows: {short_term_window}/{long_term_window}")
+    print(f"np.convolve per tick: {convolve_time:.3f} seconds")
+    print(f"Incremental:          {incremental_time:.3f} seconds")
+    print(f"Speedup: {convolve_time / incremental_time:.1f}x")
+    print(f"Max abs diff: short {short_diff:.3e}, long {long_diff:.3e}")
+    print(f"Crossover signals differing at exact ties: {int(flipped.sum())} of {len(flipped)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import os
+import argparse
+import datetime
+import tempfile
+import time
+import pandas as pd
+from sqlalchemy import text
+from benchmark_suite import make_synthetic_ohlcv, synthetic_tickers
+
+# 従来の fetch_and_store_stock_data と同じく1行ずつ INSERT する
+def row_by_row_insert(engine, ticker, data):
+    with engine.begin() as conn:
+        for index, row in data.iterrows():
+            conn.execute(text("""
+            INSERT INTO stock_data (ticker, date, open, high, low, close, adj_close, volume)
+            VALUES (:ticker, :date, :open, :high, :low, :close, :adj_close, :volume)
+            """), {
+                'ticker': ticker,
+                'date': row['date'].strftime('%Y-%m-%d'),
+                'open': row['open'],
+                'high': row['high'],
+                'low': row['low'],
+                'close': row['close'],
+                'adj_close': row['adj_close'],
+                'volume': row['volume']
+            })
+
+def count_rows(engine):
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT COUNT(*) FROM stock_data")).scalar()
+
+def main():
+    parser = argparse.ArgumentParser(description="日足の取り込みを1行ずつのINSERTとまとめてのUPSERTで比較する（rows/s）")
+    parser.add_argument('--tickers', type=int, default=200, help="合成する銘柄数")
+    parser.add_argument('--days', type=int, default=100, help="1銘柄あたりの日数")
+    args = parser.parse_args()
+
+    index = pd.bdate_range(end=datetime.date.today(), periods=args.days, name='date')
+    frames = {ticker: make_synthetic_ohlcv(index, seed=k, volatility=0.03).reset_index() for k, ticker in enumerate(synthetic_tickers(args.tickers))}
+    total_rows = args.tickers * args.days
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        # models.database は import 時のカレントディレクトリの stock_data.db を使う
+        os.chdir(work_dir)
+        from models import database
+        from models.database import migrate, stock_rows, upsert_stock_data
+
+        migrate()
+        start = time.perf_counter()
+        for ticker, data in frames.items():
+            row_by_row_insert(database.engine, ticker, data)
+        loop_time = time.perf_counter() - start
+        with database.engine.begin() as conn:
+            conn.execute(text("DELETE FROM stock_data"))
+
+        start = time.perf_counter()
+        for ticker, data in frames.items():
+            upsert_stock_data(stock_rows(ticker, data))
+        bulk_time = time.perf_counter() - start
+        inserted = count_rows(database.engine)
+
+        # 同じ期間をもう一度取り込んでも行は増えない
+        start = time.perf_counter()
+        upsert_stock_data([row for ticker, data in frames.items() for row in stock_rows(ticker, data)])
+        rerun_time = time.perf_counter() - start
+        after_rerun = count_rows(database.engine)
+        database.engine.dispose()
+        os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    if inserted != total_rows or after_rerun != total_rows:
+        raise AssertionError(f"Unexpected row count: {inserted} after insert, {after_rerun} after re-run (expected {total_rows})")
+
+    print(f"Rows: {total_rows} ({args.tickers} tickers x {args.days} days)")
+    print(f"Row-by-row INSERT: {loop_time:.3f} seconds ({total_rows / loop_time:,.0f} rows/s)")
+    print(f"Bulk UPSERT:       {bulk_time:.3f} seconds ({total_rows / bulk_time:,.0f} rows/s)")
+    print(f"Re-run UPSERT:     {rerun_time:.3f} seconds ({total_rows / rerun_time:,.0f} rows/s), no duplicate rows")
+    print(f"Speedup: {loop_time / bulk_time:.1f}x")
+
+if __name__ == "__main__":
+    main()
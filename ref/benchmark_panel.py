@@ -0,0 +1,61 @@
+import os
+import argparse
+import datetime
+import tempfile
+import time
+import pandas as pd
+from benchmark_suite import make_synthetic_ohlcv, synthetic_tickers
+
+def timed_call(func):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+def main():
+    parser = argparse.ArgumentParser(description="複数銘柄の日足の読み込みを load_stock_data のループと load_stock_data_many で比較する")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 4000], help="読み込む銘柄数")
+    parser.add_argument('--days', type=int, default=250, help="1銘柄あたりの保存する日数")
+    parser.add_argument('--window', type=int, default=60, help="読み込む直近の日数（load_stock_data の days）")
+    args = parser.parse_args()
+
+    tickers = synthetic_tickers(max(args.sizes))
+    index = pd.bdate_range(end=datetime.date.today(), periods=args.days, name='date')
+    with tempfile.TemporaryDirectory() as work_dir:
+        # models.database は import 時のカレントディレクトリの stock_data.db を使う
+        os.chdir(work_dir)
+        from models import database
+        from views.logging_setup import start_logging, stop_logging
+
+        start_logging(log_dir=work_dir)
+        database.migrate()
+        start = time.perf_counter()
+        for k, ticker in enumerate(tickers):
+            database.upsert_stock_data(database.stock_rows(ticker, make_synthetic_ohlcv(index, seed=k, volatility=0.03).reset_index()))
+        print(f"Synthetic DB: {len(tickers)} tickers x {args.days} days ({time.perf_counter() - start:.1f} s)")
+
+        rows = []
+        for size in args.sizes:
+            selected = tickers[:size]
+            loop_time, frames = timed_call(lambda: {ticker: database.load_stock_data(ticker, days=args.window) for ticker in selected})
+            panel_time, panel = timed_call(lambda: database.load_stock_data_many(selected, days=args.window))
+            compact_time, compact = timed_call(lambda: database.load_stock_data_many(selected, days=args.window, compact=True))
+            database.rebuild_price_cache(selected)
+            database.clear_data_cache()
+            cached_time, _ = timed_call(lambda: [database.load_stock_data(ticker, days=args.window) for ticker in selected])
+            database.price_cache.invalidate(selected)
+            database.clear_data_cache()
+            if len(panel) != sum(len(df) for df in frames.values()) or not panel.loc[selected[-1]].equals(frames[selected[-1]]):
+                raise AssertionError(f"load_stock_data_many returned different data for {size} tickers")
+            if not compact.frame(selected[-1]).equals(frames[selected[-1]]):
+                raise AssertionError(f"load_stock_data_many(compact=True) returned different data for {size} tickers")
+            rows.append((size, loop_time, panel_time, compact_time, cached_time))
+        stop_logging()
+        database.engine.dispose()
+        os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    print(f"{'tickers':>8}{'loop (s)':>12}{'many (s)':>12}{'speedup':>10}{'many compact (s)':>18}{'loop with price_cache (s)':>28}")
+    for size, loop_time, panel_time, compact_time, cached_time in rows:
+        print(f"{size:>8}{loop_time:>12.3f}{panel_time:>12.3f}{loop_time / panel_time:>9.1f}x{compact_time:>18.3f}{cached_time:>28.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import os
+import argparse
+import datetime
+import tempfile
+import time
+import pandas as pd
+from sqlalchemy import text
+from benchmark_suite import make_synthetic_ohlcv, synthetic_tickers
+
+# 移行前と同じ id 主キーのテーブル（(ticker, date) の索引なし）
+legacy_schema = """
+CREATE TABLE stock_data (
+    id INTEGER PRIMARY KEY,
+    ticker TEXT,
+    date DATE,
+    open REAL,
+    high REAL,
+    low REAL,
+    close REAL,
+    adj_close REAL,
+    volume INTEGER
+)
+"""
+
+def write_legacy_db(engine, tickers, days, duplicate_days):
+    # 日々の更新と同じく日付ごとに全銘柄を追記する（同じ銘柄の行がファイル中に散らばる）。
+    # 最後の duplicate_days 日分は値を修正してもう一度追記し、以前の取り込みで重複した行を再現する。
+    # 移行後に残るべき行（(ticker, date) ごとに最後に追記した行）も返す
+    from models.database import stock_rows
+
+    index = pd.bdate_range(end=datetime.date.today(), periods=days, name='date')
+    by_ticker = [stock_rows(ticker, make_synthetic_ohlcv(index, seed=k, volatility=0.03).reset_index()) for k, ticker in enumerate(tickers)]
+    rows = [ticker_rows[day] for day in range(days) for ticker_rows in by_ticker]
+    rows += [dict(ticker_rows[day], adj_close=ticker_rows[day]['adj_close'] * 0.99)
+             for day in range(days - duplicate_days, days) for ticker_rows in by_ticker]
+    latest = {(row['ticker'], row['date']): tuple(row[col] for col in ('ticker', 'date', 'open', 'high', 'low', 'close', 'adj_close', 'volume'))
+              for row in rows}
+    with engine.begin() as conn:
+        conn.execute(text(legacy_schema))
+        conn.execute(text("""
+        INSERT INTO stock_data (ticker, date, open, high, low, close, adj_close, volume)
+        VALUES (:ticker, :date, :open, :high, :low, :close, :adj_close, :volume)
+        """), rows)
+    return len(rows), [latest[key] for key in sorted(latest)]
+
+def time_queries(engine, tickers, repeat):
+    from models.database import load_stock_data, clear_data_cache
+
+    queries = {
+        'load_stock_data (days=None)': lambda ticker: load_stock_data(ticker, days=None),
+        'load_stock_data (days=30)': lambda ticker: load_stock_data(ticker, days=30),
+    }
+    timings = {}
+    for name, func in queries.items():
+        elapsed = 0.0
+        for _ in range(repeat):
+            # load_stock_data の LRU に当たらないように、毎回空にしてから測る
+            clear_data_cache()
+            start = time.perf_counter()
+            for ticker in tickers:
+                func(ticker)
+            elapsed += time.perf_counter() - start
+        timings[name] = elapsed / (repeat * len(tickers))
+    with engine.connect() as conn:
+        for name, sql in (('MAX(date)', "SELECT MAX(date) FROM stock_data WHERE ticker=:ticker"),
+                          ('EXISTS', "SELECT EXISTS(SELECT 1 FROM stock_data WHERE ticker=:ticker)")):
+            query = text(sql)
+            start = time.perf_counter()
+            for _ in range(repeat):
+                for ticker in tickers:
+                    conn.execute(query, {'ticker': ticker}).scalar()
+            timings[name] = (time.perf_counter() - start) / (repeat * len(tickers))
+    return timings
+
+def database_size(db_path):
+    # WAL モードでは未チェックポイントの書き込みが -wal ファイルに残る
+    return sum(os.path.getsize(path) for path in (db_path, db_path + '-wal') if os.path.exists(path))
+
+def snapshot(engine):
+    with engine.connect() as conn:
+        rows = conn.execute(text("""
+        SELECT ticker, date, open, high, low, close, adj_close, volume FROM stock_data ORDER BY ticker, date
+        """)).fetchall()
+    return [tuple(row) for row in rows]
+
+def main():
+    parser = argparse.ArgumentParser(description="stock_data の移行前後で load_stock_data / MAX(date) / EXISTS の時間を比較する")
+    parser.add_argument('--tickers', type=int, default=200, help="合成する銘柄数")
+    parser.add_argument('--days', type=int, default=500, help="1銘柄あたりの日数")
+    parser.add_argument('--duplicate-days', type=int, default=20, help="重複させる直近の日数")
+    parser.add_argument('--repeat', type=int, default=3, help="各クエリを全銘柄に対して繰り返す回数")
+    args = parser.parse_args()
+
+    tickers = synthetic_tickers(args.tickers)
+    with tempfile.TemporaryDirectory() as work_dir:
+        # models.database は import 時のカレントディレクトリの stock_data.db を使う
+        os.chdir(work_dir)
+        from models import database
+
+        legacy_rows, expected = write_legacy_db(database.engine, tickers, args.days, args.duplicate_days)
+        before_size = database_size(database.db_path)
+        before = time_queries(database.engine, tickers, args.repeat)
+
+        start = time.perf_counter()
+        version = database.migrate()
+        migrate_time = time.perf_counter() - start
+        after_size = database_size(database.db_path)
+        after_rows = snapshot(database.engine)
+        with database.engine.connect() as conn:
+            after_count = conn.execute(text("SELECT COUNT(*) FROM stock_data")).scalar()
+        after = time_queries(database.engine, tickers, args.repeat)
+        database.engine.dispose()
+        os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    expected_rows = args.tickers * args.days
+    if after_count != expected_rows or after_rows != expected:
+        raise AssertionError(f"Migration did not keep the latest row of each (ticker, date): {after_count} rows after migration (expected {expected_rows})")
+
+    print(f"Rows: {legacy_rows} before migration ({args.tickers} tickers x {args.days} days + duplicates), {after_count} after")
+    print(f"Migration to schema version {version}: {migrate_time:.3f} seconds, file size {before_size:,} -> {after_size:,} bytes")
+    print(f"{'query':<30}{'before (ms)':>14}{'after (ms)':>14}{'speedup':>10}")
+    for name in before:
+        print(f"{name:<30}{before[name] * 1000:>14.3f}{after[name] * 1000:>14.3f}{before[name] / after[name]:>9.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+'''benchmark_suite.py'''
+import os
+import sys
+import json
+import argparse
+import datetime
+import platform
+import subprocess
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 規模のプリセット（銘柄数, 日足の日数, 1分足の日数）
+scales = {
+    'small': {'tickers': 1, 'days': 100, 'minute_days': 5},
+    'medium': {'tickers': 100, 'days': 250, 'minute_days': 20},
+    'universe': {'tickers': 4000, 'days': 100, 'minute_days': 20},
+}
+
+# 東証の取引時間（前場・後場）の1分足の時刻
+def trading_minutes(days, start='2024-01-04'):
+    sessions = []
+    for day in pd.bdate_range(start, periods=days):
+        sessions.append(pd.date_range(day + pd.Timedelta(hours=9), day + pd.Timedelta(hours=11, minutes=29), freq='min'))
+        sessions.append(pd.date_range(day + pd.Timedelta(hours=12, minutes=30), day + pd.Timedelta(hours=14, minutes=59), freq='min'))
+    return sessions[0].append(sessions[1:]) if sessions else pd.DatetimeIndex([])
+
+def make_synthetic_ohlcv(index, start_price=400.0, volatility=0.02, seed=0):
+    """index の各時刻の OHLCV を幾何ランダムウォークで作る（open は前の足の close）。"""
+    rng = np.random.default_rng(seed)
+    n = len(index)
+    close = np.round(start_price * np.exp(np.cumsum(rng.normal(0, volatility, n))), 1)
+    open_ = np.concatenate(([start_price], close[:-1]))
+    spread = np.abs(rng.normal(0, volatility / 2, n))
+    high = np.round(np.maximum(open_, close) * (1 + spread), 1)
+    low = np.round(np.minimum(open_, close) * (1 - spread), 1)
+    volume = rng.integers(100, 100000, n) * 100
+    return pd.DataFrame({'open': open_, 'high': high, 'low': low, 'close': close, 'adj_close': close, 'volume': volume}, index=index)
+
+def synthetic_tickers(count, start=1000):
+    # 東証の4桁コードに似せた銘柄コード
+    return [str(start + i) for i in range(count)]
+
+def write_synthetic_db(tickers, days, seed=0):
+    # カレントディレクトリの stock_data.db に合成の日足を入れる（取り込みと同じ migrate / upsert_stock_data を使う）
+    from models.database import migrate, stock_rows, upsert_stock_data
+
+    migrate()
+    index = pd.bdate_range(end=datetime.date.today(), periods=days, name='date')
+    rows = []
+    for k, ticker in enumerate(tickers):
+        rows.extend(stock_rows(ticker, make_synthetic_ohlcv(index, seed=seed + k, volatility=0.03).reset_index()))
+    upsert_stock_data(rows)
+
+def write_synthetic_intraday_csv(csv_filename, minute_days, seed=0):
+    # yfinance の1分足CSVと同じ列名で書き出す
+    df = make_synthetic_ohlcv(trading_minutes(minute_days), start_price=1500.0, volatility=0.002, seed=seed)
+    df.index.name = 'Datetime'
+    df.rename(columns={'open': 'Open', 'high': 'High', 'low': 'Low', 'close': 'Close', 'adj_close': 'Adj Close', 'volume': 'Volume'}).to_csv(csv_filename)
+    return len(df)
+
+def measure(name, func, items, **info):
+    start, cpu_start = time.perf_counter(), time.process_time()
+    func()
+    seconds, cpu_seconds = time.perf_counter() - start, time.process_time() - cpu_start
+    print(f"{name:<28}{seconds:>10.3f} s{items / seconds if seconds > 0 else 0.0:>14.1f} items/s", file=sys.stderr)
+    return {'name': name, 'seconds': seconds, 'cpu_seconds': cpu_seconds, 'items': items,
+            'items_per_second': items / seconds if seconds > 0 else None, **info}
+
+def skipped(name, reason):
+    print(f"{name:<28}skipped ({reason})", file=sys.stderr)
+    return {'name': name, 'skipped': reason}
+
+def bench_backtest(work_dir, minute_days, seed):
+    # トップレベルの backtest() は ref と別のパッケージなので benchmark_backtest.py を別プロセスで実行する
+    csv_filename = os.path.join(work_dir, 'synthetic_intraday.csv')
+    bars = write_synthetic_intraday_csv(csv_filename, minute_days, seed)
+    json_filename = os.path.join(work_dir, 'benchmark_backtest.json')
+    completed = subprocess.run([sys.executable, os.path.join(repo_root, 'benchmark_backtest.py'), '--csv', csv_filename, '--json', json_filename],
+                               cwd=work_dir, capture_output=True, text=True)
+    if completed.returncode != 0:
+        return [skipped('backtest', completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else f"exit {completed.returncode}")]
+    with open(json_filename) as f:
+        timings = json.load(f)
+    results = []
+    for name, key in [('backtest', 'loop_seconds'), ('vectorized_backtest', 'vectorized_seconds'),
+                      ('crossover_loop_backtest', 'crossover_loop_seconds'), ('crossover_backtest', 'crossover_vectorized_seconds')]:
+        items = timings['combinations'] if 'crossover' not in name else 1
+        results.append({'name': name, 'seconds': timings[key], 'items': items, 'items_per_second': items / timings[key] if timings[key] > 0 else None, 'bars': bars})
+        print(f"{name:<28}{timings[key]:>10.3f} s", file=sys.stderr)
+    return results
+
+def bench_optimize_parameters(tickers):
+    from config.vars import upper_limits, lower_limits, initial_capital, min_data_points
+    from models.database import load_stock_data
+    from controllers.optimal_parameter_finder import optimize_parameters
+
+    df = load_stock_data(tickers[0], days=min_data_points)
+    param_combinations = [(ul, ll) for ul in upper_limits for ll in lower_limits]
+    return measure('optimize_parameters', lambda: [optimize_parameters(df, ul, ll, tickers[0], initial_capital) for ul, ll in param_combinations],
+                   len(param_combinations), days=len(df))
+
+def bench_process_ticker(tickers):
+    from controllers.optimal_parameter_finder import safe_process_ticker
+
+    errors = []
+    def run():
+        for ticker_symbol in tickers:
+            _, error = safe_process_ticker(ticker_symbol, use_cache=False)
+            if error:
+                errors.append(error)
+    result = measure('process_ticker', run, len(tickers))
+    result['errors'] = len(errors)
+    return result
+
+def bench_load_stock_data(tickers):
+    from models import price_cache
+    from models.database import load_stock_data, rebuild_price_cache, clear_data_cache
+
+    # SQL から読む場合と price_cache（memory-map）から読む場合（プロセス内の LRU は毎回空にする）
+    price_cache.invalidate(tickers)
+    clear_data_cache()
+    results = [measure('load_stock_data', lambda: [load_stock_data(ticker_symbol, days=None) for ticker_symbol in tickers], len(tickers))]
+    rebuild_price_cache(tickers)
+    clear_data_cache()
+    results.append(measure('load_stock_data_cached', lambda: [load_stock_data(ticker_symbol, days=None) for ticker_symbol in tickers], len(tickers)))
+    return results
+
+def bench_download_stock_data(tickers, days, latency):
+    from models.database import migrate
+    from models.market_data import MarketDataDownloader, FakeDataSource
+
+    # 偽のデータソース（1回 latency 秒）で、従来どおり1銘柄ずつ順番に取得する場合とまとめて並列に取得する場合を比べる
+    migrate()
+    end_date = datetime.date.today()
+    start_date = end_date - datetime.timedelta(days=int(days * 7 / 5))
+    jobs = [(ticker_symbol, start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')) for ticker_symbol in tickers]
+    results = []
+    for name, workers, batch_size in (('download_stock_data_serial', 1, 1), ('download_stock_data', 4, 50)):
+        downloader = MarketDataDownloader(FakeDataSource(latency=latency), workers=workers, batch_size=batch_size, rate=1000.0)
+        results.append(measure(name, lambda: downloader.run(jobs), len(tickers), days=days, latency=latency, workers=workers, batch_size=batch_size))
+    return results
+
+def bench_upsert_stock_data(tickers, days, seed):
+    from models.database import migrate, stock_rows, upsert_stock_data
+
+    migrate()
+    index = pd.bdate_range(end=datetime.date.today(), periods=days, name='date')
+    rows = []
+    for k, ticker_symbol in enumerate(tickers):
+        rows.extend(stock_rows(ticker_symbol, make_synthetic_ohlcv(index, seed=seed + k, volatility=0.03).reset_index()))
+    return measure('upsert_stock_data', lambda: upsert_stock_data(rows), len(rows), tickers=len(tickers), days=days)
+
+def git_revision():
+    completed = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=repo_root, capture_output=True, text=True)
+    return completed.stdout.strip() or None
+
+def compare_with_baseline(results, baseline, tolerance):
+    """baseline と比べて1件あたりの時間が tolerance を超えて遅くなったベンチマーク名のリストを返す。"""
+    if baseline.get('scale') != results['scale']:
+        print(f"Warning: scale differs from baseline ({baseline.get('scale')} vs {results['scale']})")
+    per_item = lambda b: b['seconds'] / b['items'] if b.get('items') else b['seconds']
+    baseline_per_item = {b['name']: per_item(b) for b in baseline['benchmarks'] if 'seconds' in b}
+    regressions = []
+    for r in results['benchmarks']:
+        if 'seconds' not in r or r['name'] not in baseline_per_item:
+            continue
+        before, after = baseline_per_item[r['name']], per_item(r)
+        ratio = after / before if before > 0 else float('inf')
+        regressed = ratio > 1 + tolerance
+        if regressed:
+            regressions.append(r['name'])
+        print(f"{r['name']:<28}{before * 1000:>10.3f} ms ->{after * 1000:>10.3f} ms per item ({ratio:.2f}x){'  REGRESSION' if regressed else ''}")
+    return regressions
+
+benchmark_names = ['backtest', 'optimize_parameters', 'process_ticker', 'load_stock_data', 'upsert_stock_data', 'download_stock_data']
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="合成データでバックテスト・最適化・DBの処理時間を計測し、JSONに保存する")
+    parser.add_argument('--scale', choices=list(scales), default='small', help="銘柄数・日数のプリセット")
+    parser.add_argument('--tickers', type=int, help="合成する銘柄数（プリセットを上書き）")
+    parser.add_argument('--days', type=int, help="合成する日足の日数（プリセットを上書き）")
+    parser.add_argument('--minute-days', type=int, help="backtest() に使う1分足の日数（プリセットを上書き）")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--download-latency', type=float, default=0.05, help="download_stock_data の偽のデータソースの1回あたりの待ち時間（秒）")
+    parser.add_argument('--only', nargs='+', choices=benchmark_names,
+                        help="実行するベンチマーク（省略時はすべて）")
+    parser.add_argument('--output', default='benchmark_results.json', help="結果のJSONファイル")
+    parser.add_argument('--baseline', help="比較する以前の結果のJSONファイル")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="baseline より何割遅くなったら回帰とみなすか")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    scale = dict(scales[args.scale])
+    for key in ('tickers', 'days', 'minute_days'):
+        if getattr(args, key) is not None:
+            scale[key] = getattr(args, key)
+    selected = set(args.only or benchmark_names)
+    output = os.path.abspath(args.output)
+    tickers = synthetic_tickers(scale['tickers'])
+    benchmarks = []
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        # ref のモジュールは import 時のカレントディレクトリに stock_data.db やログを作るので、作業ディレクトリに移ってから読み込む
+        os.chdir(work_dir)
+        from views.logging_setup import start_logging, stop_logging
+        start_logging(log_dir=work_dir)
+        if selected & {'optimize_parameters', 'process_ticker', 'load_stock_data'}:
+            start = time.perf_counter()
+            write_synthetic_db(tickers, scale['days'], args.seed)
+            print(f"Synthetic DB: {len(tickers)} tickers x {scale['days']} days ({time.perf_counter() - start:.1f} s)", file=sys.stderr)
+
+        if 'backtest' in selected:
+            benchmarks.extend(bench_backtest(work_dir, scale['minute_days'], args.seed))
+        if 'optimize_parameters' in selected:
+            benchmarks.append(bench_optimize_parameters(tickers))
+        if 'process_ticker' in selected:
+            benchmarks.append(bench_process_ticker(tickers))
+        if 'load_stock_data' in selected:
+            benchmarks.extend(bench_load_stock_data(tickers))
+        if 'upsert_stock_data' in selected:
+            benchmarks.append(bench_upsert_stock_data(synthetic_tickers(len(tickers), start=10000), scale['days'], args.seed))
+        if 'download_stock_data' in selected:
+            benchmarks.extend(bench_download_stock_data(synthetic_tickers(len(tickers), start=5000), scale['days'], args.download_latency))
+        stop_logging()
+        os.chdir(repo_root)
+
+    results = {
+        'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'scale': {'name': args.scale, **scale},
+        'benchmarks': benchmarks,
+    }
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(results, baseline, args.tolerance)
+        if regressions:
+            print(f"Regressions: {', '.join(regressions)}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import os
+import argparse
+import hashlib
+import tempfile
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pandas as pd
+import requests
+from benchmark_suite import synthetic_tickers
+
+class ListServer(BaseHTTPRequestHandler):
+    """財務省のサーバーの代わりに list.xlsx を返す。conditional が False なら ETag を付けず常に 200 を返す。"""
+    content = b''
+    conditional = True
+    requests_served = 0
+
+    def do_GET(self):
+        type(self).requests_served += 1
+        etag = '"' + hashlib.sha256(self.content).hexdigest()[:16] + '"'
+        if self.conditional and self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+        self.send_header('Content-Length', str(len(self.content)))
+        if self.conditional:
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified', formatdate(usegmt=True))
+        self.end_headers()
+        self.wfile.write(self.content)
+
+    def log_message(self, format, *args):
+        pass
+
+def make_workbook(filename, codes, extra_sheets=3, extra_rows=5000):
+    # 本物と同じく、銘柄リストのシートのほかに大きなシートがいくつかあるワークブック
+    from models.ticker_universe import sheet_name, code_column
+    listing = pd.DataFrame({'会社名\n(Company name)': [f"Company {code}" for code in codes], code_column: codes,
+                            '業種\n(Industry)': ['industry'] * len(codes)})
+    with pd.ExcelWriter(filename) as writer:
+        listing.to_excel(writer, sheet_name=sheet_name, index=False)
+        for k in range(extra_sheets):
+            pd.DataFrame({'name': [f"row {i}" for i in range(extra_rows)], 'value': range(extra_rows)}).to_excel(writer, sheet_name=f"sheet{k}", index=False)
+    with open(filename, 'rb') as f:
+        return f.read()
+
+def timed_refresh(ticker_universe, url, session):
+    start = time.perf_counter()
+    result = ticker_universe.refresh(url, session=session)
+    return time.perf_counter() - start, result
+
+def main():
+    parser = argparse.ArgumentParser(description="銘柄リストの更新を、毎回ダウンロードしてワークブック全体を読む方法と条件付き取得・ハッシュ確認で比較する（ローカルのHTTPサーバーを使う）")
+    parser.add_argument('--tickers', type=int, default=4000, help="銘柄リストの銘柄数")
+    parser.add_argument('--changed', type=int, default=20, help="更新後のリストで追加・削除する銘柄数")
+    args = parser.parse_args()
+
+    codes = synthetic_tickers(args.tickers + args.changed)
+    before, after = codes[:args.tickers], codes[args.changed:]
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ListServer)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/list.xlsx"
+    session = requests.Session()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        # models.ticker_universe はカレントディレクトリの tickersymbolslist に保存する
+        os.chdir(work_dir)
+        from models import ticker_universe
+
+        ListServer.content = make_workbook('before.xlsx', before)
+        print(f"Workbook: {len(ListServer.content) / 1024:.0f} KB, {args.tickers} codes")
+
+        start = time.perf_counter()
+        xls = pd.ExcelFile(pd.io.common.BytesIO(session.get(url).content))
+        old_df = pd.read_excel(xls, sheet_name=ticker_universe.sheet_name)
+        old_time = time.perf_counter() - start
+
+        rows = [('download + parse whole workbook (old)', old_time, f"{len(old_df)} rows")]
+        elapsed, result = timed_refresh(ticker_universe, url, session)
+        rows.append(('first refresh (download + parse code column)', elapsed, result['status']))
+        served = ListServer.requests_served
+        elapsed, result = timed_refresh(ticker_universe, url, session)
+        rows.append(('conditional request, not modified', elapsed, f"{result['status']} (status 304: {ListServer.requests_served == served + 1})"))
+        ListServer.conditional = False
+        elapsed, result = timed_refresh(ticker_universe, url, session)
+        rows.append(('server without ETag, same workbook', elapsed, result['status']))
+        ListServer.content = make_workbook('after.xlsx', after)
+        elapsed, result = timed_refresh(ticker_universe, url, session)
+        rows.append(('changed workbook', elapsed, f"{result['status']} (+{len(result['added'])} / -{len(result['removed'])})"))
+        start = time.perf_counter()
+        universe = ticker_universe.load_universe()
+        load_time = time.perf_counter() - start
+        csv_time = time.perf_counter()
+        pd.read_csv(ticker_universe.csv_path, encoding='utf-8-sig')['ticker_symbol'].astype(str).tolist()
+        csv_time = time.perf_counter() - csv_time
+        if universe.tolist() != sorted(after) or result['added'] != after[-args.changed:] or result['removed'] != before[:args.changed]:
+            raise AssertionError("refresh() stored a different universe or diff")
+        os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    server.shutdown()
+
+    for name, elapsed, note in rows:
+        print(f"{name:<48}{elapsed:>9.3f} s  {note}")
+    print(f"{'load universe (.npy)':<48}{load_time:>9.4f} s")
+    print(f"{'load universe (CSV)':<48}{csv_time:>9.4f} s")
+
+if __name__ == "__main__":
+    main()
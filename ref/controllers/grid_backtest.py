@@ -0,0 +1,115 @@
+'''grid_backtest.py'''
+import numpy as np
+from config.vars import short_term_window, long_term_window
+from models.result_cache import lookup_results, store_results
+from utils.indicator_cache import data_version
+from utils.instrumentation import timed, count
+
+# 売買ルールを変えたら上げる（バックテスト結果のキャッシュのキーに使う）
+strategy_version = f"threshold-ma-v1:{short_term_window}:{long_term_window}"
+
+def moving_average_signal(trade_controller):
+    # trading_logic と同じ条件で「短期MA > 長期MA」を判定する（計算できない場合は None）
+    if len(trade_controller.historical_prices) < long_term_window:
+        return None
+    short_term_ma = trade_controller.moving_averages.short.value
+    long_term_ma = trade_controller.moving_averages.long.value
+    if short_term_ma is None or long_term_ma is None:
+        return None
+    return bool(short_term_ma > long_term_ma)
+
+def run_grid_backtest(prices, upper_limits, lower_limits, initial_capital, ma_signal):
+    """(upper_limit, lower_limit) の全組み合わせを1回の価格ループでまとめてバックテストする。
+
+    組み合わせの並びは [(ul, ll) for ul in upper_limits for ll in lower_limits] と同じ。
+    ma_signal は moving_average_signal() の戻り値で、None の場合は売買しない。
+    戻り値は (final_value, profit_loss, trades_executed) の配列。
+    """
+    upper = np.repeat(np.asarray(upper_limits, dtype=np.float64), len(lower_limits))
+    lower = np.tile(np.asarray(lower_limits, dtype=np.float64), len(upper_limits))
+    return run_pair_backtest(prices, upper, lower, initial_capital, ma_signal)
+
+@timed('backtest')
+def run_pair_backtest(prices, upper, lower, initial_capital, ma_signal, starts=None, stops=None):
+    """upper[k], lower[k] の組ごとにバックテストする（run_grid_backtest・探索戦略・ウォークフォワードで共用）。
+
+    ma_signal は組ごとの配列でもよい。starts/stops を渡すと、組 k は prices[starts[k]:stops[k]] の
+    期間だけ売買し、最終価値は prices[stops[k] - 1] で評価する。
+    """
+    prices = np.asarray(prices, dtype=np.float64)
+    upper = np.asarray(upper, dtype=np.float64)
+    lower = np.asarray(lower, dtype=np.float64)
+    n_params = len(upper)
+    count('backtests', n_params)
+    windowed = starts is not None
+    if windowed:
+        starts = np.asarray(starts)
+        stops = np.asarray(stops)
+
+    capital = np.full(n_params, initial_capital, dtype=np.float64)
+    holding_quantity = np.zeros(n_params, dtype=np.float64)
+    average_price = np.zeros(n_params, dtype=np.float64)
+    trades_executed = np.zeros(n_params, dtype=bool)
+
+    if ma_signal is not None and len(prices) > 0:
+        first, last = (int(starts.min()), int(stops.max())) if windowed else (0, len(prices))
+        for t in range(first, last):
+            price = prices[t]
+            flat = holding_quantity == 0
+
+            # 買い: ポジションがなく100株以上買える場合
+            buy_quantity = np.where(flat, (capital // price) // 100 * 100, 0)
+            buy = buy_quantity > 0
+
+            # 売り: upper_limit 以上（上昇トレンド時のみ）または lower_limit 以下
+            target_upper = average_price * upper
+            target_lower = average_price * lower
+            sell = ~flat & (((price >= target_upper) & ma_signal) | (price <= target_lower))
+            sell_quantity = np.where(sell, (holding_quantity // 100) * 100, 0)
+            sell &= sell_quantity > 0
+
+            if windowed:
+                in_window = (starts <= t) & (t < stops)
+                buy &= in_window
+                sell &= in_window
+
+            if buy.any():
+                quantity = buy_quantity[buy]
+                capital[buy] -= quantity * price
+                holding_quantity[buy] += quantity
+                average_price[buy] = ((average_price[buy] * (holding_quantity[buy] - quantity)) + (price * quantity)) / holding_quantity[buy]
+
+            if sell.any():
+                quantity = sell_quantity[sell]
+                capital[sell] += quantity * price
+                holding_quantity[sell] -= quantity
+                average_price[sell & (holding_quantity == 0)] = 0
+
+            trades_executed |= buy | sell
+
+    if windowed:
+        last_price = prices[stops - 1]
+    else:
+        last_price = prices[-1] if len(prices) > 0 else 0.0
+    final_value = capital + holding_quantity * last_price
+    profit_loss = final_value - initial_capital
+    return final_value, profit_loss, trades_executed
+
+def cached_grid_backtest(ticker_symbol, df, upper_limits, lower_limits, initial_capital, ma_signal):
+    """run_grid_backtest と同じ結果を (upper_limit, lower_limit, final_value, profit_loss, trades_executed) のリストで返す。
+
+    同じ価格データ・戦略・初期資金で計算済みの組み合わせはキャッシュから取り出し、足りない組み合わせだけを計算する。
+    """
+    param_combinations = [(ul, ll) for ul in upper_limits for ll in lower_limits]
+    data_hash = data_version(df)
+    results = lookup_results(ticker_symbol, data_hash, strategy_version, initial_capital, param_combinations)
+
+    missing = [p for p in param_combinations if p not in results]
+    if missing:
+        upper, lower = zip(*missing)
+        final_values, profit_losses, trades_executed = run_pair_backtest(df['close'].to_numpy(), upper, lower, initial_capital, ma_signal)
+        computed = {p: (fv, pl, te) for p, fv, pl, te in zip(missing, final_values.tolist(), profit_losses.tolist(), trades_executed.tolist())}
+        store_results(ticker_symbol, data_hash, strategy_version, initial_capital, computed)
+        results.update(computed)
+
+    return [p + results[p] for p in param_combinations]
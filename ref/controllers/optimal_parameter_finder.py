@@ -1,19 +1,28 @@
-import os
-import datetime
+import sys
+import argparse
 import logging
 import pandas as pd
 import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from config.vars import ticker_symbols, upper_limits, lower_limits, initial_capital, min_data_points
-from models.database import load_stock_data
+from models.database import load_stock_data, dispose_engine
+from models.result_cache import cache_stats, reset_cache_stats, dispose_cache_engine
+from models.results_store import save_run, best_params, dispose_results_engine
 from controllers.trade import TradeController
-from views.logging_setup import setup_logging
+from controllers.grid_backtest import moving_average_signal, run_grid_backtest, cached_grid_backtest, strategy_version
+from controllers.parameter_search import GridEvaluator, search_strategies, compare_search_strategies
+from controllers.walk_forward import walk_forward, print_walk_forward
+from controllers.portfolio import align_close_prices, run_portfolio_backtest
+from views.logging_setup import setup_logging, start_logging
 from utils.trend import determine_trend
+from utils.indicator_cache import get_indicators, data_version
+from utils import instrumentation
 
 def optimize_parameters(df, upper_limit, lower_limit, ticker_symbol, initial_capital):
     trade_controller = TradeController(df, ticker_symbol, initial_capital)
 
     for price in df['close']:
-        logging.info(f"Current price: {price}")
+        logging.debug("Current price: %s", price)
         action, quantity = trade_controller.trading_logic(price, upper_limit, lower_limit)
 
         if action == 'buy':
@@ -25,52 +34,271 @@ def optimize_parameters(df, upper_limit, lower_limit, ticker_symbol, initial_cap
     profit_loss = final_value - initial_capital
     return final_value, profit_loss
 
-def save_results_to_csv(ticker_symbol, results, log_dir):
-    results_df = pd.DataFrame(results, columns=['upper_limit', 'lower_limit', 'final_value', 'profit_loss'])
-    results_filename = os.path.join(log_dir, f'{ticker_symbol.replace(".", "_")}_optimal_parameters_results_{datetime.datetime.now().strftime("%Y%m%d%H%M")}.csv')
-    os.makedirs(os.path.dirname(results_filename), exist_ok=True)
-    results_df.to_csv(results_filename, index=False)
-    logging.info(f"Backtest results saved to {results_filename}")
-
-def process_ticker(ticker_symbol):
-    log_dir = setup_logging(ticker_symbol)
+def process_ticker(ticker_symbol, search='grid', budget=None, use_cache=True):
+    setup_logging(ticker_symbol)
     df = load_stock_data(ticker_symbol, days=min_data_points)
 
     param_combinations = [(ul, ll) for ul in upper_limits for ll in lower_limits]
 
+    indicators = get_indicators(ticker_symbol, df)
+    ma_signal = moving_average_signal(TradeController(df, ticker_symbol, initial_capital, indicators))
+    reset_cache_stats()
+    if search == 'grid' and use_cache:
+        # 計算済みの組み合わせはキャッシュから取り出し、残りだけを1回の価格ループでまとめて計算する
+        evaluated = [r[:4] for r in cached_grid_backtest(ticker_symbol, df, upper_limits, lower_limits, initial_capital, ma_signal)]
+    elif search == 'grid':
+        # 全組み合わせを1回の価格ループでまとめて計算する
+        final_values, profit_losses, _ = run_grid_backtest(df['close'].to_numpy(), upper_limits, lower_limits, initial_capital, ma_signal)
+        evaluated = [(ul, ll, fv, pl) for (ul, ll), fv, pl in zip(param_combinations, final_values.tolist(), profit_losses.tolist())]
+    else:
+        # 予算内で探索し、評価した組み合わせだけを結果とする
+        evaluator = GridEvaluator(df['close'].to_numpy(), upper_limits, lower_limits, initial_capital, ma_signal)
+        evaluated = search_strategies[search](evaluator, budget or len(param_combinations) // 4)["results"]
+
     best_upper_limit, best_lower_limit = None, None
     best_profit_loss = float('-inf')
     results = []
 
-    for upper_limit, lower_limit in param_combinations:
-        final_value, profit_loss = optimize_parameters(df, upper_limit, lower_limit, ticker_symbol, initial_capital)
+    for upper_limit, lower_limit, final_value, profit_loss in evaluated:
         results.append((upper_limit, lower_limit, final_value, profit_loss))
         if profit_loss > best_profit_loss:
             best_upper_limit = upper_limit
             best_lower_limit = lower_limit
             best_profit_loss = profit_loss
 
-        logging.info(f"Upper limit: {upper_limit}, Lower limit: {lower_limit}, Final value: {final_value}, Profit/Loss: {profit_loss}")
+        logging.info("Upper limit: %s, Lower limit: %s, Final value: %s, Profit/Loss: %s", upper_limit, lower_limit, final_value, profit_loss)
 
     # トレンドの判定
-    trend = determine_trend(df['close'])
+    trend = determine_trend(df['close'], indicators)
+
+    # 結果を結果DBに追記
+    run_id = save_run(ticker_symbol, results, source='optimizer' if search == 'grid' else f'optimizer:{search}',
+                      data_hash=data_version(df), strategy_version=strategy_version, initial_capital=initial_capital)
+
+    return {
+        "ticker": ticker_symbol,
+        "best_upper_limit": best_upper_limit,
+        "best_lower_limit": best_lower_limit,
+        "best_profit_loss": best_profit_loss,
+        "current_trend": trend,
+        "backtests": len(evaluated),
+        "run_id": run_id,
+        "cache_hits": cache_stats()['hits'],
+        "cache_misses": cache_stats()['misses']
+    }
 
-    print(f"Ticker: {ticker_symbol}")
-    print(f"Best upper limit: {best_upper_limit}")
-    print(f"Best lower limit: {best_lower_limit}")
-    print(f"Best Profit/Loss: {best_profit_loss}")
-    print(f"Current Trend: {trend}")
+def print_result(result):
+    print(f"Ticker: {result['ticker']}")
+    print(f"Best upper limit: {result['best_upper_limit']}")
+    print(f"Best lower limit: {result['best_lower_limit']}")
+    print(f"Best Profit/Loss: {result['best_profit_loss']}")
+    print(f"Current Trend: {result['current_trend']}")
+    print(f"Backtests: {result['backtests']}")
     print()
 
-    # 結果をCSVに保存
-    save_results_to_csv(ticker_symbol, results, log_dir)
+def print_best_params(ticker_symbol, last_runs):
+    rows = best_params(ticker_symbol, last_runs)
+    if rows.empty:
+        print(f"Ticker: {ticker_symbol} (no stored runs)")
+        print()
+        return
+    print(f"Ticker: {ticker_symbol} (best parameters over the last {last_runs} runs)")
+    for row in rows.itertuples():
+        print(f"  upper {row.upper_limit}, lower {row.lower_limit}: mean Profit/Loss {row.mean_profit_loss:.1f} "
+              f"(min {row.min_profit_loss:.1f}, max {row.max_profit_loss:.1f}, {row.runs} runs)")
+    print()
+
+# 各探索戦略が総当たりの最適値にどこまで近づくかと、必要なバックテスト数を表示する
+def search_report(ticker_symbol, budget):
+    df = load_stock_data(ticker_symbol, days=min_data_points)
+    ma_signal = moving_average_signal(TradeController(df, ticker_symbol, initial_capital))
+    prices = df['close'].to_numpy()
+    rows = compare_search_strategies(lambda: GridEvaluator(prices, upper_limits, lower_limits, initial_capital, ma_signal), budget)
+
+    print(f"Ticker: {ticker_symbol} (budget: {budget})")
+    print(f"{'strategy':<20}{'upper':>8}{'lower':>8}{'profit_loss':>14}{'gap':>12}{'backtests':>11}")
+    for row in rows:
+        print(f"{row['strategy']:<20}{row['best_upper_limit']:>8}{row['best_lower_limit']:>8}"
+              f"{row['best_profit_loss']:>14.1f}{row['gap']:>12.1f}{row['backtests']:>11}")
+    print()
+
+# 1銘柄の失敗で全体を止めないように例外を結果として返す
+def safe_process_ticker(ticker_symbol, search='grid', budget=None, use_cache=True):
+    try:
+        return process_ticker(ticker_symbol, search, budget, use_cache), None
+    except Exception as e:
+        logging.error(f"Failed to process ticker {ticker_symbol}: {e}")
+        return None, f"{type(e).__name__}: {e}"
+
+# 複数銘柄を1つの資金で運用した場合の成績を表示する（limits を省略すると銘柄ごとの最適値を使う）
+def portfolio_report(tickers, upper_limit=None, lower_limit=None, max_weight=None):
+    frames, uppers, lowers, signals = {}, [], [], []
+    for ticker_symbol in tickers:
+        try:
+            df = load_stock_data(ticker_symbol, days=min_data_points)
+        except FileNotFoundError as e:
+            print(f"Skipped: {ticker_symbol} ({e})")
+            continue
+        ma_signal = moving_average_signal(TradeController(df, ticker_symbol, initial_capital))
+        if upper_limit is None or lower_limit is None:
+            _, profit_losses, _ = run_grid_backtest(df['close'].to_numpy(), upper_limits, lower_limits, initial_capital, ma_signal)
+            best = int(profit_losses.argmax())
+            best_upper, best_lower = upper_limits[best // len(lower_limits)], lower_limits[best % len(lower_limits)]
+        frames[ticker_symbol] = df
+        uppers.append(upper_limit if upper_limit is not None else best_upper)
+        lowers.append(lower_limit if lower_limit is not None else best_lower)
+        signals.append(ma_signal)
+
+    if not frames:
+        print("No tickers with data for the portfolio backtest")
+        return
+    result = run_portfolio_backtest(align_close_prices(frames), uppers, lowers, initial_capital, signals, max_weight)
+
+    print(f"Portfolio: {len(frames)} tickers, initial capital {initial_capital}")
+    for (ticker_symbol, position), upper, lower in zip(result['positions'].items(), uppers, lowers):
+        print(f"  {ticker_symbol}: upper {upper}, lower {lower}, trades {position['trades']}, holding {position['holding_quantity']:.0f}")
+    print(f"Final value: {result['final_value']}")
+    print(f"Profit/Loss: {result['profit_loss']}")
+
+# プロセスプールの各ワーカーで親プロセスのSQLite接続を使い回さないようにする
+def init_worker(instrument=False, trace_memory=False, log_level=logging.INFO):
+    dispose_engine()
+    dispose_cache_engine()
+    dispose_results_engine()
+    start_logging(log_level)
+    if instrument:
+        instrumentation.enable(trace_memory)
+
+# ワーカーでは銘柄ごとに計測をリセットし、結果と一緒に親プロセスへ返す
+def pooled_process_ticker(ticker_symbol, search, budget, use_cache):
+    instrumentation.reset()
+    outcome = safe_process_ticker(ticker_symbol, search, budget, use_cache)
+    return outcome, instrumentation.summary(top_allocations=0) if instrumentation.is_enabled() else None
+
+def load_ticker_symbols(csv_filename):
+    df = pd.read_csv(csv_filename, encoding='utf-8-sig')
+    return df['ticker_symbol'].astype(str).tolist()
+
+def run_tickers(tickers, workers=1, search='grid', budget=None, use_cache=True):
+    """銘柄ごとの (result, error) を tickers と同じ順で返す。"""
+    outcomes = [None] * len(tickers)
+    start_time = time.time()
+
+    def report(done, ticker_symbol, error):
+        elapsed = time.time() - start_time
+        status = f"failed ({error})" if error else "ok"
+        print(f"[{done}/{len(tickers)}] {ticker_symbol} {status} - {done / elapsed if elapsed > 0 else 0.0:.2f} tickers/s", file=sys.stderr)
+
+    if workers <= 1:
+        for i, ticker_symbol in enumerate(tickers):
+            outcomes[i] = safe_process_ticker(ticker_symbol, search, budget, use_cache)
+            report(i + 1, ticker_symbol, outcomes[i][1])
+    else:
+        initargs = (instrumentation.is_enabled(), instrumentation.is_tracing_memory(), logging.getLogger().getEffectiveLevel())
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=initargs) as executor:
+            futures = {executor.submit(pooled_process_ticker, ticker_symbol, search, budget, use_cache): i for i, ticker_symbol in enumerate(tickers)}
+            for done, future in enumerate(as_completed(futures), start=1):
+                i = futures[future]
+                try:
+                    outcomes[i], worker_summary = future.result()
+                    instrumentation.merge(worker_summary)
+                except Exception as e:  # ワーカープロセス自体が落ちた場合
+                    outcomes[i] = (None, f"{type(e).__name__}: {e}")
+                report(done, tickers[i], outcomes[i][1])
+    instrumentation.count('tickers_failed', sum(1 for _, error in outcomes if error))
+    instrumentation.count('tickers_processed', len(tickers))
+    return outcomes
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="銘柄ごとに最適なupper_limit/lower_limitを探索する")
+    parser.add_argument('--workers', type=int, default=1, help="並列に処理するプロセス数（1なら逐次処理）")
+    parser.add_argument('--tickers-csv', help="銘柄リストのCSV（例: tickersymbolslist/tokyo_ticker_symbols.csv）。省略時は config.vars.ticker_symbols")
+    parser.add_argument('--no-cache', action='store_true', help="バックテスト結果のキャッシュを使わずに全組み合わせを計算する")
+    parser.add_argument('--search', choices=list(search_strategies), default='grid', help="パラメータの探索方法（既定は総当たり）")
+    parser.add_argument('--budget', type=int, default=50, help="grid 以外の探索で実行するバックテスト数の上限")
+    parser.add_argument('--search-report', action='store_true', help="各探索方法を総当たりと比較して表示する")
+    parser.add_argument('--walk-forward', action='store_true', help="DBの全期間で学習期間・検証期間をずらしながら評価する")
+    parser.add_argument('--train-days', type=int, default=min_data_points, help="ウォークフォワードの学習期間（日数）")
+    parser.add_argument('--test-days', type=int, default=10, help="ウォークフォワードの検証期間（日数）")
+    parser.add_argument('--step-days', type=int, help="ウォークフォワードで窓をずらす日数（省略時は検証期間と同じ）")
+    parser.add_argument('--portfolio', action='store_true', help="全銘柄を1つの資金（initial_capital）でまとめてバックテストする")
+    parser.add_argument('--upper-limit', type=float, help="--portfolio で全銘柄に使う upper_limit（省略時は銘柄ごとの最適値）")
+    parser.add_argument('--lower-limit', type=float, help="--portfolio で全銘柄に使う lower_limit（省略時は銘柄ごとの最適値）")
+    parser.add_argument('--max-weight', type=float, help="--portfolio で1銘柄に使える評価額の割合（省略時は均等配分）")
+    parser.add_argument('--best-params', action='store_true', help="結果DBに保存済みの直近の実行から、平均損益が大きいパラメータを表示する")
+    parser.add_argument('--runs', type=int, default=10, help="--best-params で集計する直近の実行回数")
+    parser.add_argument('--instrument', nargs='?', const='', metavar='FILE',
+                        help="段階ごとの処理時間・件数を計測してJSONに保存する（FILE 省略時は optimal_parameter_log/ に保存）")
+    parser.add_argument('--trace-memory', action='store_true', help="--instrument で tracemalloc によるメモリ使用量も記録する")
+    parser.add_argument('--log-level', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], default='INFO',
+                        help="ログレベル（DEBUG にすると1足ごとの状態も記録する）")
+    return parser.parse_args()
 
 def main():
+    args = parse_args()
+    start_logging(args.log_level)
+    if args.instrument is None:
+        run(args)
+        return
+
+    instrumentation.enable(trace_memory=args.trace_memory)
+    try:
+        run(args)
+    finally:
+        summary_filename = args.instrument or instrumentation.default_summary_path('optimal_parameter_finder', 'optimal_parameter_log')
+        instrumentation.write_summary(summary_filename, command='optimal_parameter_finder', argv=sys.argv[1:])
+        print(f"Instrumentation summary saved to {summary_filename}")
+
+def run(args):
+    tickers = load_ticker_symbols(args.tickers_csv) if args.tickers_csv else ticker_symbols
+
+    if args.best_params:
+        for ticker_symbol in tickers:
+            print_best_params(ticker_symbol, args.runs)
+        return
+
+    if args.search_report:
+        for ticker_symbol in tickers:
+            try:
+                search_report(ticker_symbol, args.budget)
+            except Exception as e:
+                print(f"Failed: {ticker_symbol} ({type(e).__name__}: {e})")
+        return
+
+    if args.portfolio:
+        portfolio_report(tickers, args.upper_limit, args.lower_limit, args.max_weight)
+        return
+
+    if args.walk_forward:
+        for ticker_symbol in tickers:
+            try:
+                results, stage_seconds = walk_forward(ticker_symbol, args.train_days, args.test_days, args.step_days)
+                print_walk_forward(ticker_symbol, results, stage_seconds)
+            except Exception as e:
+                print(f"Failed: {ticker_symbol} ({type(e).__name__}: {e})")
+        return
+
     start_time = time.time()  # 処理開始時間の記録
-    for ticker_symbol in ticker_symbols:
-        process_ticker(ticker_symbol)
+    outcomes = run_tickers(tickers, workers=args.workers, search=args.search, budget=args.budget, use_cache=not args.no_cache)
     end_time = time.time()  # 処理終了時間の記録
     elapsed_time = end_time - start_time  # 経過時間の計算
+
+    failed = []
+    for ticker_symbol, (result, error) in zip(tickers, outcomes):
+        if error:
+            failed.append((ticker_symbol, error))
+        else:
+            print_result(result)
+
+    for ticker_symbol, error in failed:
+        print(f"Failed: {ticker_symbol} ({error})")
+    succeeded = [result for result, error in outcomes if not error]
+    cache_hits = sum(result['cache_hits'] for result in succeeded)
+    cache_misses = sum(result['cache_misses'] for result in succeeded)
+    if cache_hits + cache_misses:
+        print(f"Backtest cache: {cache_hits} hits, {cache_misses} misses")
+    throughput = len(tickers) / elapsed_time if elapsed_time > 0 else 0.0
+    print(f"Processed {len(tickers) - len(failed)}/{len(tickers)} tickers ({throughput:.2f} tickers/s)")
     print(f"Processing time: {elapsed_time:.2f} seconds")
     logging.info(f"Processing time: {elapsed_time:.2f} seconds")
 
@@ -0,0 +1,165 @@
+'''parameter_search.py'''
+import math
+import numpy as np
+from controllers.grid_backtest import run_pair_backtest
+
+class GridEvaluator:
+    """upper_limits × lower_limits の格子点 (i, j) をバックテストし、実行した回数を数える。
+
+    同じ点・同じ期間の結果は再計算しない。start を指定すると prices[start:] だけで評価する。
+    """
+
+    def __init__(self, prices, upper_limits, lower_limits, initial_capital, ma_signal):
+        self.prices = np.asarray(prices, dtype=np.float64)
+        self.upper_limits = np.asarray(upper_limits, dtype=np.float64)
+        self.lower_limits = np.asarray(lower_limits, dtype=np.float64)
+        self.initial_capital = initial_capital
+        self.ma_signal = ma_signal
+        self.backtests = 0
+        self._results = {}
+
+    @property
+    def shape(self):
+        return len(self.upper_limits), len(self.lower_limits)
+
+    def is_evaluated(self, point, start=0):
+        return (point, start) in self._results
+
+    def evaluate(self, points, start=0):
+        missing = list(dict.fromkeys(p for p in points if (p, start) not in self._results))
+        if missing:
+            index = np.array(missing)
+            final_values, profit_losses, _ = run_pair_backtest(
+                self.prices[start:], self.upper_limits[index[:, 0]], self.lower_limits[index[:, 1]],
+                self.initial_capital, self.ma_signal)
+            self.backtests += len(missing)
+            for point, final_value, profit_loss in zip(missing, final_values.tolist(), profit_losses.tolist()):
+                self._results[(point, start)] = (final_value, profit_loss)
+        return [self._results[(p, start)][1] for p in points]
+
+    def results(self, start=0):
+        # start の期間で評価済みの点を (upper_limit, lower_limit, final_value, profit_loss) で返す
+        points = sorted(p for p, s in self._results if s == start)
+        return [(self.upper_limits[i].item(), self.lower_limits[j].item()) + self._results[((i, j), start)] for i, j in points]
+
+def _best(evaluator, points, start=0):
+    # 利益が同じなら格子の並び順で先の点を選ぶ（総当たりと同じ選び方）
+    profits = evaluator.evaluate(points, start)
+    return min(zip(points, profits), key=lambda item: (-item[1], item[0]))
+
+def _summary(name, evaluator):
+    results = evaluator.results()
+    best = min(results, key=lambda r: (-r[3], r[0], r[1]))
+    return {
+        "strategy": name,
+        "best_upper_limit": best[0],
+        "best_lower_limit": best[1],
+        "best_profit_loss": best[3],
+        "backtests": evaluator.backtests,
+        "results": results
+    }
+
+def exhaustive_search(evaluator, budget=None):
+    n_upper, n_lower = evaluator.shape
+    evaluator.evaluate([(i, j) for i in range(n_upper) for j in range(n_lower)])
+    return _summary("grid", evaluator)
+
+def coarse_to_fine_search(evaluator, budget):
+    """粗い格子で全体を評価し、最良点の周囲を間隔を半分にしながら探索する。"""
+    n_upper, n_lower = evaluator.shape
+    budget = max(1, budget)
+
+    # 予算の半分程度を粗い格子に使う
+    stride = max(1, int(math.sqrt(n_upper * n_lower / max(budget / 2, 1))))
+    while True:
+        coarse = [(i, j) for i in range(stride // 2, n_upper, stride) for j in range(stride // 2, n_lower, stride)]
+        if len(coarse) <= budget:
+            break
+        stride += 1
+    best_point, best_profit = _best(evaluator, coarse)
+
+    while evaluator.backtests < budget:
+        neighbours = [(best_point[0] + di * stride, best_point[1] + dj * stride)
+                      for di in (-1, 0, 1) for dj in (-1, 0, 1)]
+        neighbours = [(i, j) for i, j in neighbours
+                      if 0 <= i < n_upper and 0 <= j < n_lower and not evaluator.is_evaluated((i, j))]
+        neighbours = neighbours[:budget - evaluator.backtests]
+        improved = False
+        if neighbours:
+            point, profit = _best(evaluator, neighbours)
+            if profit > best_profit:
+                best_point, best_profit, improved = point, profit, True
+        if stride == 1 and not improved:
+            break
+        if not improved:
+            stride = max(1, stride // 2)
+
+    return _summary("coarse_to_fine", evaluator)
+
+def random_search(evaluator, budget, seed=0):
+    n_upper, n_lower = evaluator.shape
+    rng = np.random.default_rng(seed)
+    chosen = rng.choice(n_upper * n_lower, size=min(budget, n_upper * n_lower), replace=False)
+    evaluator.evaluate([divmod(int(k), n_lower) for k in chosen])
+    return _summary("random", evaluator)
+
+def latin_hypercube_search(evaluator, budget, seed=0):
+    """各軸を budget 個の区間に分け、どの区間からも1点ずつ選ぶように標本を取る。"""
+    n_upper, n_lower = evaluator.shape
+    rng = np.random.default_rng(seed)
+    size = min(budget, n_upper * n_lower)
+
+    upper_index = ((rng.permutation(size) + rng.random(size)) / size * n_upper).astype(int)
+    lower_index = ((rng.permutation(size) + rng.random(size)) / size * n_lower).astype(int)
+    points = list(dict.fromkeys(zip(upper_index.tolist(), lower_index.tolist())))
+
+    # 格子が粗く重複した分は未評価の点から補う
+    if len(points) < size:
+        taken = set(points)
+        rest = [divmod(int(k), n_lower) for k in rng.permutation(n_upper * n_lower)]
+        points += [p for p in rest if p not in taken][:size - len(points)]
+    evaluator.evaluate(points)
+    return _summary("latin_hypercube", evaluator)
+
+def successive_halving_search(evaluator, budget, eta=3, seed=0):
+    """候補を直近の短い期間で評価し、上位 1/eta だけを長い期間に進める。最後の段は全期間で評価する。"""
+    n_upper, n_lower = evaluator.shape
+    n_prices = len(evaluator.prices)
+    rng = np.random.default_rng(seed)
+
+    # 段数 rungs のとき、候補数 n は n * (1 + 1/eta + 1/eta^2 + ...) <= budget を満たす
+    n_candidates = min(n_upper * n_lower, budget)
+    rungs = max(1, int(math.log(n_candidates, eta)) + 1) if n_candidates > 1 else 1
+    while n_candidates > 1 and sum(math.ceil(n_candidates / eta ** k) for k in range(rungs)) > budget:
+        n_candidates -= 1
+        rungs = max(1, int(math.log(n_candidates, eta)) + 1) if n_candidates > 1 else 1
+
+    candidates = [divmod(int(k), n_lower) for k in rng.choice(n_upper * n_lower, size=n_candidates, replace=False)]
+    for rung in range(rungs):
+        window = max(2, int(n_prices / eta ** (rungs - 1 - rung)))
+        start = max(0, n_prices - window) if rung < rungs - 1 else 0
+        profits = evaluator.evaluate(candidates, start)
+        ranked = sorted(zip(candidates, profits), key=lambda item: (-item[1], item[0]))
+        if rung < rungs - 1:
+            candidates = [p for p, _ in ranked[:max(1, math.ceil(len(candidates) / eta))]]
+
+    return _summary("successive_halving", evaluator)
+
+search_strategies = {
+    "grid": exhaustive_search,
+    "coarse_to_fine": coarse_to_fine_search,
+    "successive_halving": successive_halving_search,
+    "random": random_search,
+    "latin_hypercube": latin_hypercube_search
+}
+
+def compare_search_strategies(make_evaluator, budget):
+    """各戦略の最良値と総当たりの最適値との差、実行したバックテスト数を返す。"""
+    optimum = exhaustive_search(make_evaluator())
+    rows = [dict(optimum, gap=0.0)]
+    for name, strategy in search_strategies.items():
+        if name == "grid":
+            continue
+        summary = strategy(make_evaluator(), budget)
+        rows.append(dict(summary, gap=optimum["best_profit_loss"] - summary["best_profit_loss"]))
+    return rows
@@ -0,0 +1,75 @@
+'''portfolio.py'''
+import numpy as np
+import pandas as pd
+
+def align_close_prices(frames):
+    """銘柄ごとの DataFrame を共通の日付で揃えた終値のパネル（行: 日付, 列: 銘柄）にする。データがない日は NaN。"""
+    return pd.concat({ticker: df['close'] for ticker, df in frames.items()}, axis=1).sort_index()
+
+def run_portfolio_backtest(panel, upper_limits, lower_limits, initial_capital, ma_signals, max_weight=None):
+    """複数銘柄を1つの資金でまとめてバックテストする。
+
+    売買ルールは銘柄ごとに TradeController.trading_logic と同じで、各足で全銘柄を配列としてまとめて処理する。
+    - 売りを先に処理し、得た現金は同じ足の買いに使える
+    - 1銘柄に使える金額はその時点の評価額 * max_weight（既定は均等配分）まで
+    - 買いは100株単位で、同じ足で複数銘柄が買う場合は列の順に現金の範囲内で約定する
+    upper_limits, lower_limits, ma_signals はスカラーまたは銘柄数の配列。ma_signals が None の銘柄は売買しない。
+    """
+    tickers = list(panel.columns)
+    prices = panel.to_numpy(dtype=np.float64)
+    n_days, n_tickers = prices.shape
+
+    upper = np.broadcast_to(np.asarray(upper_limits, dtype=np.float64), (n_tickers,))
+    lower = np.broadcast_to(np.asarray(lower_limits, dtype=np.float64), (n_tickers,))
+    signals = np.broadcast_to(np.asarray(ma_signals, dtype=object), (n_tickers,))
+    tradable = np.array([s is not None for s in signals])
+    ma_up = np.array([bool(s) for s in signals])
+    weight = max_weight if max_weight is not None else 1.0 / n_tickers
+
+    cash = float(initial_capital)
+    holding_quantity = np.zeros(n_tickers, dtype=np.float64)
+    average_price = np.zeros(n_tickers, dtype=np.float64)
+    trades = np.zeros(n_tickers, dtype=np.int64)
+    last_price = np.full(n_tickers, np.nan)
+    equity = np.empty(n_days, dtype=np.float64)
+
+    for t in range(n_days):
+        valid = tradable & ~np.isnan(prices[t])
+        price = np.where(valid, prices[t], 1.0)  # NaN の銘柄は売買しないので計算用の仮の値
+        last_price = np.where(np.isnan(prices[t]), last_price, prices[t])
+
+        # 売り: upper_limit 以上（上昇トレンド時のみ）または lower_limit 以下
+        sell = valid & (holding_quantity > 0) & (((price >= average_price * upper) & ma_up) | (price <= average_price * lower))
+        sell_quantity = np.where(sell, (holding_quantity // 100) * 100, 0)  # 100株単位に調整
+        sell &= sell_quantity > 0
+        if sell.any():
+            cash += float(np.sum(sell_quantity[sell] * price[sell]))
+            holding_quantity[sell] -= sell_quantity[sell]
+            average_price[sell & (holding_quantity == 0)] = 0
+            trades[sell] += 1
+
+        # 買い: ポジションがない銘柄を、1銘柄の上限と共通の現金の範囲内で100株単位で買う
+        flat = valid & (holding_quantity == 0) & ~sell
+        portfolio_value = cash + np.nansum(holding_quantity * last_price)
+        budget = min(portfolio_value * weight, cash)
+        buy_quantity = np.where(flat, (budget // price) // 100 * 100, 0)
+        cost = buy_quantity * price
+        buy = (buy_quantity > 0) & (np.cumsum(cost) <= cash)
+        if buy.any():
+            quantity = buy_quantity[buy]
+            cash -= float(np.sum(cost[buy]))
+            holding_quantity[buy] += quantity
+            average_price[buy] = ((average_price[buy] * (holding_quantity[buy] - quantity)) + (price[buy] * quantity)) / holding_quantity[buy]
+            trades[buy] += 1
+
+        equity[t] = cash + np.nansum(holding_quantity * last_price)
+
+    final_value = equity[-1] if n_days else float(initial_capital)
+    return {
+        "final_value": float(final_value),
+        "profit_loss": float(final_value - initial_capital),
+        "cash": cash,
+        "positions": {ticker: {"holding_quantity": float(q), "average_price": float(a), "trades": int(n)}
+                      for ticker, q, a, n in zip(tickers, holding_quantity, average_price, trades)},
+        "equity": pd.Series(equity, index=panel.index, name="equity")
+    }
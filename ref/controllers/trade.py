@@ -1,7 +1,8 @@
 '''trade.py'''
 import logging
 import numpy as np
-from config.vars import short_term_window, long_term_window
+from config.vars import long_term_window
+from utils.indicator_cache import get_indicators, load_daily_prices
 
 class TradeModel:
     def __init__(self, initial_capital):
@@ -15,7 +16,7 @@ class TradeModel:
             self.capital -= quantity * price
             self.holding_quantity += quantity
             self.average_price = ((self.average_price * (self.holding_quantity - quantity)) + (price * quantity)) / self.holding_quantity
-            logging.info(f"Bought {quantity} shares at {price} each. New capital: {self.capital}, Holding: {self.holding_quantity}, Average purchase price: {self.average_price}")
+            logging.info("Bought %s shares at %s each. New capital: %s, Holding: %s, Average purchase price: %s", quantity, price, self.capital, self.holding_quantity, self.average_price)
 
     def sell_stock(self, price, quantity):
         quantity = min(quantity, (self.holding_quantity // 100) * 100)  # 100株単位に調整
@@ -24,29 +25,27 @@ class TradeModel:
             self.holding_quantity -= quantity
             if self.holding_quantity == 0:
                 self.average_price = 0
-            logging.info(f"Sold {quantity} shares at {price} each. New capital: {self.capital}, Holding: {self.holding_quantity}, Average purchase price: {self.average_price}")
+            logging.info("Sold %s shares at %s each. New capital: %s, Holding: %s, Average purchase price: %s", quantity, price, self.capital, self.holding_quantity, self.average_price)
 
 
 class TradeController:
-    def __init__(self, df, symbol, initial_capital):
+    def __init__(self, df, symbol, initial_capital, indicators=None):
         self.model = TradeModel(initial_capital)
         self.logger = logging.getLogger()
         self.symbol = symbol
-        self.historical_prices = self.get_daily_prices(df)
+        # 日足終値と移動平均は銘柄・データごとにキャッシュしたものを共有する
+        self.indicators = indicators if indicators is not None else get_indicators(symbol, df)
+        self.historical_prices = self.indicators.daily_prices
+        self.moving_averages = self.indicators.moving_averages
 
     def get_daily_prices(self, df):
-        try:
-            daily_df = df.resample('D').agg({'close': 'last'}).dropna()
-            return daily_df['close'].tolist()
-        except Exception as e:
-            self.logger.error(f"Error loading daily prices: {e}")
-            return []
+        return load_daily_prices(df)
 
     def calculate_moving_average(self, prices, window):
         if len(prices) < window:
             return None
         moving_average = np.convolve(prices, np.ones(window), 'valid') / window
-        self.logger.info(f"Calculated moving average for window {window}: {moving_average}")
+        self.logger.debug("Calculated moving average for window %s: %s", window, moving_average)
         return moving_average
 
     def trading_logic(self, current_price, upper_limit, lower_limit):
@@ -56,31 +55,33 @@ class TradeController:
             self.logger.error("Not enough historical data to calculate moving averages.")
             return action, quantity
 
-        short_term_ma = self.calculate_moving_average(self.historical_prices, short_term_window)
-        long_term_ma = self.calculate_moving_average(self.historical_prices, long_term_window)
+        # 移動平均は初期化時に累積和で計算済みのものを参照する
+        short_term_ma = self.moving_averages.short.value
+        long_term_ma = self.moving_averages.long.value
 
-        if any(x is None for x in [short_term_ma, long_term_ma]) or any(len(x) == 0 for x in [short_term_ma, long_term_ma]):
+        if short_term_ma is None or long_term_ma is None:
             self.logger.error("Error calculating moving averages.")
             return action, quantity
 
-        min_length = min(len(short_term_ma), len(long_term_ma))
-        short_term_ma, long_term_ma = short_term_ma[-min_length:], long_term_ma[-min_length:]
-
-        self.logger.info(f"Short-term MA: {short_term_ma[-1]}, Long-term MA: {long_term_ma[-1]}")
-        self.logger.info(f"Before Action - Capital: {self.model.capital}, Holding Quantity: {self.model.holding_quantity}, Average Price: {self.model.average_price}")
+        # 1足ごとの状態は DEBUG（既定の INFO では整形もしない）
+        debug = self.logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            self.logger.debug("Short-term MA: %s, Long-term MA: %s", short_term_ma, long_term_ma)
+            self.logger.debug("Before Action - Capital: %s, Holding Quantity: %s, Average Price: %s", self.model.capital, self.model.holding_quantity, self.model.average_price)
 
         if self.model.holding_quantity == 0:
             quantity = (self.model.capital // current_price) // 100 * 100  # 100株単位に調整
             if quantity > 0:
                 action = 'buy'
             else:
-                self.logger.error(f"Not enough capital to buy at price {current_price}.")
+                self.logger.error("Not enough capital to buy at price %s.", current_price)
         else:
-            if current_price >= self.model.average_price * upper_limit and short_term_ma[-1] > long_term_ma[-1]:
+            if current_price >= self.model.average_price * upper_limit and short_term_ma > long_term_ma:
                 action, quantity = 'sell', (self.model.holding_quantity // 100) * 100  # 100株単位に調整
             elif current_price <= self.model.average_price * lower_limit:
                 action, quantity = 'sell', (self.model.holding_quantity // 100) * 100  # 100株単位に調整
 
-        self.logger.info(f"After Action - Capital: {self.model.capital}, Holding Quantity: {self.model.holding_quantity}, Average Price: {self.model.average_price}")
-        self.logger.info(f"Action: {action}, Quantity: {quantity}, Price: {current_price}")
+        if debug:
+            self.logger.debug("After Action - Capital: %s, Holding Quantity: %s, Average Price: %s", self.model.capital, self.model.holding_quantity, self.model.average_price)
+            self.logger.debug("Action: %s, Quantity: %s, Price: %s", action, quantity, current_price)
         return action, quantity
@@ -0,0 +1,120 @@
+'''walk_forward.py'''
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+import numpy as np
+from config.vars import upper_limits, lower_limits, initial_capital, short_term_window, long_term_window
+from models.database import load_stock_data
+from controllers.grid_backtest import run_pair_backtest
+from utils.indicator_cache import get_indicators
+
+class StageTimer:
+    """段階ごとの経過時間を合計する。"""
+
+    def __init__(self):
+        self.seconds = OrderedDict()
+
+    @contextmanager
+    def measure(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[stage] = self.seconds.get(stage, 0.0) + time.perf_counter() - start
+
+def make_folds(n_days, train_days, test_days, step_days=None):
+    # (学習開始, 学習終了=検証開始, 検証終了) の添字。step_days ごとに窓をずらす
+    step_days = step_days or test_days
+    folds = []
+    start = 0
+    while start + train_days + test_days <= n_days:
+        folds.append((start, start + train_days, start + train_days + test_days))
+        start += step_days
+    return folds
+
+def moving_average_signals(indicators):
+    """日足の各日について、その日までのデータで「短期MA > 長期MA」を判定した配列（計算できない日は None）。
+
+    全期間の移動平均を一度だけ計算し、各フォールドはその日の値を参照する。
+    """
+    n_days = len(indicators.daily_prices)
+    signals = [None] * n_days
+    if indicators.long_term_ma is None:
+        return signals
+    for t in range(long_term_window - 1, n_days):
+        signals[t] = bool(indicators.short_term_ma[t - short_term_window + 1] > indicators.long_term_ma[t - long_term_window + 1])
+    return signals
+
+def walk_forward(ticker_symbol, train_days, test_days, step_days=None):
+    """学習期間で最適な (upper_limit, lower_limit) を選び、直後の検証期間で成績を測る。
+
+    DB からは全期間を1回だけ読み込み、日足と移動平均も1回だけ計算する。学習は全フォールド×全組み合わせ、
+    検証は全フォールドをそれぞれ1回の価格ループでまとめて計算する。
+    """
+    timer = StageTimer()
+
+    with timer.measure("load"):
+        df = load_stock_data(ticker_symbol, days=None)
+
+    with timer.measure("indicators"):
+        indicators = get_indicators(ticker_symbol, df)
+        prices = np.asarray(indicators.daily_prices, dtype=np.float64)
+        dates = indicators.daily_dates
+        signals = moving_average_signals(indicators)
+
+    if train_days < long_term_window:
+        raise ValueError(f"train_days must be at least long_term_window ({long_term_window})")
+    folds = make_folds(len(prices), train_days, test_days, step_days)
+    if not folds:
+        raise ValueError(f"Not enough data for walk-forward: {len(prices)} days, train {train_days}, test {test_days}")
+
+    n_params = len(upper_limits) * len(lower_limits)
+    train_starts = np.array([f[0] for f in folds])
+    train_stops = np.array([f[1] for f in folds])
+    test_stops = np.array([f[2] for f in folds])
+    # 学習・検証とも学習期間の最終日時点の移動平均で判定する（検証期間の先読みをしない）
+    fold_signals = np.array([signals[stop - 1] for stop in train_stops], dtype=bool)
+
+    with timer.measure("train"):
+        upper = np.tile(np.repeat(np.asarray(upper_limits, dtype=np.float64), len(lower_limits)), len(folds))
+        lower = np.tile(np.tile(np.asarray(lower_limits, dtype=np.float64), len(upper_limits)), len(folds))
+        _, train_profits, _ = run_pair_backtest(
+            prices, upper, lower, initial_capital, np.repeat(fold_signals, n_params),
+            starts=np.repeat(train_starts, n_params), stops=np.repeat(train_stops, n_params))
+        train_profits = train_profits.reshape(len(folds), n_params)
+        best = train_profits.argmax(axis=1)
+        best_upper = upper[:n_params][best]
+        best_lower = lower[:n_params][best]
+
+    with timer.measure("test"):
+        _, test_profits, test_trades = run_pair_backtest(
+            prices, best_upper, best_lower, initial_capital, fold_signals,
+            starts=train_stops, stops=test_stops)
+
+    results = []
+    for k, (train_start, test_start, test_stop) in enumerate(folds):
+        results.append({
+            "fold": k + 1,
+            "train_start": dates[train_start].date(),
+            "train_end": dates[test_start - 1].date(),
+            "test_start": dates[test_start].date(),
+            "test_end": dates[test_stop - 1].date(),
+            "best_upper_limit": best_upper[k].item(),
+            "best_lower_limit": best_lower[k].item(),
+            "train_profit_loss": train_profits[k, best[k]].item(),
+            "test_profit_loss": test_profits[k].item(),
+            "test_trades_executed": bool(test_trades[k])
+        })
+    return results, timer.seconds
+
+def print_walk_forward(ticker_symbol, results, stage_seconds):
+    print(f"Ticker: {ticker_symbol} (walk-forward, {len(results)} folds)")
+    print(f"{'fold':>4}  {'train':<23}  {'test':<23}{'upper':>7}{'lower':>7}{'train_pl':>12}{'test_pl':>12}")
+    for r in results:
+        print(f"{r['fold']:>4}  {str(r['train_start']) + '..' + str(r['train_end']):<23}  "
+              f"{str(r['test_start']) + '..' + str(r['test_end']):<23}{r['best_upper_limit']:>7}{r['best_lower_limit']:>7}"
+              f"{r['train_profit_loss']:>12.1f}{r['test_profit_loss']:>12.1f}")
+    total = sum(r['test_profit_loss'] for r in results)
+    print(f"Total out-of-sample Profit/Loss: {total:.1f}")
+    print("Stage times: " + ", ".join(f"{stage} {seconds:.3f}s" for stage, seconds in stage_seconds.items()))
+    print()
@@ -1,6 +1,6 @@
 from flask import Flask, request, jsonify, render_template
 from controllers.optimal_parameter_finder import process_ticker
-from models.database import check_ticker_symbol
+from models.database import check_ticker_symbol, data_cache_stats
 
 app = Flask(__name__)
 
@@ -24,6 +24,11 @@ def optimize():
 
     return jsonify(result)
 
+# 日足の読み込みキャッシュ（このワーカープロセス分）の統計
+@app.route('/cache_stats')
+def cache_stats():
+    return jsonify(data_cache_stats())
+
 @app.route('/help')
 def help():
     return render_template('helppage.html')
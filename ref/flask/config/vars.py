@@ -14,8 +14,9 @@ steps = 0.01
 min_data_points = 30
 
 # パラメータの組み合わせ
-upper_limits = np.round(np.arange(upper_limit_range[0], upper_limit_range[1] + steps, steps), 2).tolist()
-lower_limits = np.round(np.arange(lower_limit_range[0], lower_limit_range[1] + steps, steps), 2).tolist()
+step_decimals = max(2, int(np.ceil(-np.log10(steps))))  # steps = 0.001 なら小数点以下3桁
+upper_limits = np.round(np.arange(upper_limit_range[0], upper_limit_range[1] + steps, steps), step_decimals).tolist()
+lower_limits = np.round(np.arange(lower_limit_range[0], lower_limit_range[1] + steps, steps), step_decimals).tolist()
 
 # 移動平均の期間
 short_term_window = 5
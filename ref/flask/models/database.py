@@ -1,19 +1,292 @@
 '''database.py'''
 import os
+import sys
+import inspect
 import datetime
+import functools
+import threading
+from collections import OrderedDict
+import numpy as np
 import pandas as pd
 import logging
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, event, text
+from utils.instrumentation import timed, count
+from models import price_cache
+from utils.compact import CompactPanel
 
 # データベースの設定
 db_filename = 'stock_data.db'
 db_path = os.path.join(os.getcwd(), db_filename)
 engine = create_engine(f'sqlite:///{db_path}')
 
+# 1回の executemany で送る行数
+insert_chunk_size = 5000
+# load_stock_data_many で1回のクエリに入れる銘柄数（UNION ALL でつなげる SELECT は SQLite の既定で500まで）
+load_chunk_size = 250
+
+# 接続ごとに設定する PRAGMA（WAL で読み込みと書き込みを並行させ、キャッシュと mmap を広げる）
+sqlite_pragmas = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -64000,  # 約64MB
+    'temp_store': 'MEMORY',
+    'mmap_size': 268435456,
+    'busy_timeout': 30000,
+}
+
+def configure_sqlite(target_engine):
+    @event.listens_for(target_engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in sqlite_pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+configure_sqlite(engine)
+
+def _create_stock_data(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS stock_data (
+        id INTEGER PRIMARY KEY,
+        ticker TEXT,
+        date DATE,
+        open REAL,
+        high REAL,
+        low REAL,
+        close REAL,
+        adj_close REAL,
+        volume INTEGER
+    )
+    """)
+
+def _deduplicate_ticker_date(conn):
+    # 以前の取り込みで重複した (ticker, date) は最後に入れた行（最新のダウンロード）だけ残してから一意キーを作る。
+    # upsert_stock_data() も新しい値で上書きするので、移行した DB と取り込み直した DB で同じ値になる
+    deleted = conn.execute("DELETE FROM stock_data WHERE id NOT IN (SELECT MAX(id) FROM stock_data GROUP BY ticker, date)").rowcount
+    if deleted > 0:
+        logging.info("Removed %s duplicate rows from stock_data", deleted)
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_stock_data_ticker_date ON stock_data (ticker, date)")
+
+def _rebuild_without_rowid(conn):
+    # (ticker, date) を主キーにした WITHOUT ROWID テーブルに作り直し、銘柄ごとの行を連続して格納する
+    conn.execute("DROP TABLE IF EXISTS stock_data_new")
+    conn.execute("""
+    CREATE TABLE stock_data_new (
+        ticker TEXT NOT NULL,
+        date DATE NOT NULL,
+        open REAL,
+        high REAL,
+        low REAL,
+        close REAL,
+        adj_close REAL,
+        volume INTEGER,
+        PRIMARY KEY (ticker, date)
+    ) WITHOUT ROWID
+    """)
+    conn.execute("""
+    INSERT INTO stock_data_new (ticker, date, open, high, low, close, adj_close, volume)
+    SELECT ticker, date, open, high, low, close, adj_close, volume FROM stock_data
+    WHERE ticker IS NOT NULL AND date IS NOT NULL ORDER BY ticker, date
+    """)
+    conn.execute("DROP TABLE stock_data")
+    conn.execute("ALTER TABLE stock_data_new RENAME TO stock_data")
+
+# スキーマの移行（n 番目の関数で版 n にする）。版は PRAGMA user_version に記録する
+migrations = [_create_stock_data, _deduplicate_ticker_date, _rebuild_without_rowid]
+# 適用後に VACUUM でファイルを詰める版
+compacting_versions = {3}
+
+def schema_version():
+    with engine.connect() as conn:
+        return conn.execute(text("PRAGMA user_version")).scalar()
+
+def migrate():
+    """stock_data のスキーマを最新の版にし、版を返す。
+
+    書き込みロック（BEGIN IMMEDIATE）を取って1つのトランザクションで移行するので、途中で失敗しても元の版のまま残り、
+    複数のプロセスから同時に呼んでも移行は1回だけ行われる。
+    """
+    raw_connection = engine.raw_connection()
+    try:
+        conn = raw_connection.driver_connection
+        isolation_level = conn.isolation_level
+        conn.isolation_level = None  # BEGIN/COMMIT を自分で発行する
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            current = conn.execute("PRAGMA user_version").fetchone()[0]
+            if current > len(migrations):
+                conn.execute("ROLLBACK")
+                logging.warning("stock_data schema version %s is newer than this code (%s)", current, len(migrations))
+                return current
+            try:
+                for version in range(current + 1, len(migrations) + 1):
+                    migrations[version - 1](conn)
+                    logging.info("Migrated stock_data to schema version %s", version)
+                conn.execute(f"PRAGMA user_version={len(migrations)}")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            if compacting_versions & set(range(current + 1, len(migrations) + 1)):
+                conn.execute("VACUUM")
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")  # VACUUM で大きくなった -wal を縮める
+        finally:
+            conn.isolation_level = isolation_level
+    finally:
+        raw_connection.close()
+    if current < len(migrations):
+        # 移行で重複行や NULL の行を消すことがあるので、移行前に読んだ LRU の結果を使わせない
+        bump_data_version()
+    return len(migrations)
+
+def stock_rows(ticker, data):
+    """列名を stock_data に合わせた日足の DataFrame（列 date, open, ..., volume）を INSERT 用の dict のリストにする。"""
+    dates = pd.to_datetime(data['date']).dt.strftime('%Y-%m-%d').tolist()
+    volumes = data['volume'].fillna(0).astype('int64').tolist()
+    columns = [data[col].astype('float64').tolist() for col in ('open', 'high', 'low', 'close', 'adj_close')]
+    return [{'ticker': ticker, 'date': date, 'open': o, 'high': h, 'low': l, 'close': c, 'adj_close': a, 'volume': v}
+            for date, o, h, l, c, a, v in zip(dates, *columns, volumes)]
+
+@timed('db_store')
+def upsert_stock_data(rows):
+    """stock_rows() の行をまとめて書き込む。(ticker, date) が既にあれば値を上書きする。書き込んだ行数を返す。"""
+    query = text("""
+    INSERT INTO stock_data (ticker, date, open, high, low, close, adj_close, volume)
+    VALUES (:ticker, :date, :open, :high, :low, :close, :adj_close, :volume)
+    ON CONFLICT (ticker, date) DO UPDATE SET
+        open=excluded.open, high=excluded.high, low=excluded.low, close=excluded.close,
+        adj_close=excluded.adj_close, volume=excluded.volume
+    """)
+    with engine.begin() as conn:
+        for start in range(0, len(rows), insert_chunk_size):
+            conn.execute(query, rows[start:start + insert_chunk_size])
+    price_cache.invalidate({row['ticker'] for row in rows})
+    return len(rows)
+
+@timed('price_cache')
+def rebuild_price_cache(tickers=None):
+    """price_cache に日足を書き出し、書き出した銘柄数を返す。
+
+    tickers を省略すると、キャッシュのない銘柄（upsert_stock_data で書き換えて消えたものを含む）だけを書き出す。
+    """
+    query = text("SELECT date, open, high, low, close, adj_close, volume FROM stock_data WHERE ticker=:ticker ORDER BY date")
+    written = 0
+    with engine.connect() as conn:
+        if tickers is None:
+            tickers = sorted({row[0] for row in conn.execute(text("SELECT DISTINCT ticker FROM stock_data"))} - price_cache.cached_tickers())
+        for ticker in tickers:
+            rows = conn.execute(query, {'ticker': ticker}).fetchall()
+            if not rows:
+                price_cache.invalidate([ticker])
+                continue
+            dates, *columns, volume = zip(*rows)
+            price_cache.write_ticker(ticker, np.array(dates, dtype='datetime64[us]'), np.array(columns, dtype='float64'),
+                                     np.array([v or 0 for v in volume], dtype='int64'))
+            written += 1
+    logging.info(f"Rebuilt price cache for {written} tickers")
+    return written
+
+# 読み込み結果のプロセス内 LRU。件数と（DataFrame の）バイト数の両方で上限を決める
+data_cache_max_entries = 256
+data_cache_max_bytes = 64 * 1024 * 1024
+# 取り込みのたびに initialize_and_update_stock_data.py が書き換えるデータの版（変わったら LRU を捨てる）
+data_version_path = db_path + '.version'
+
+_data_cache = OrderedDict()
+_data_cache_bytes = 0
+_data_cache_version = None
+_data_cache_stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+_data_cache_lock = threading.Lock()
+
+def data_version():
+    # ファイルを置き換えるので inode と更新時刻で変化が分かる（SQLite には問い合わせない）
+    try:
+        stat = os.stat(data_version_path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns)
+
+def bump_data_version():
+    """データの版を1つ上げ、他のプロセスの LRU も次の読み込みで捨てられるようにする。新しい版を返す。"""
+    try:
+        with open(data_version_path) as f:
+            version = int(f.read().strip() or 0) + 1
+    except FileNotFoundError:
+        version = 1
+    with open(data_version_path + '.tmp', 'w') as f:
+        f.write(str(version))
+    os.replace(data_version_path + '.tmp', data_version_path)
+    clear_data_cache()
+    return version
+
+def _result_bytes(value):
+    if isinstance(value, pd.DataFrame):
+        # memory_usage() より速い概算（列はすべて数値）
+        return len(value) * sum(dtype.itemsize for dtype in value.dtypes) + value.index.nbytes
+    return sys.getsizeof(value)
+
+def lru_cached(func):
+    """読み込み関数の結果を引数ごとに LRU に入れる。返す DataFrame は呼び出し元で共有するので書き換えないこと。"""
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        global _data_cache_bytes, _data_cache_version
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        key = (func.__name__, tuple(bound.arguments.items()))
+        version = data_version()
+        with _data_cache_lock:
+            if version != _data_cache_version:
+                if _data_cache:
+                    _data_cache_stats['invalidations'] += 1
+                _data_cache.clear()
+                _data_cache_bytes = 0
+                _data_cache_version = version
+            entry = _data_cache.get(key)
+            if entry is not None:
+                _data_cache.move_to_end(key)
+                _data_cache_stats['hits'] += 1
+                count('data_cache_hits')
+                return entry[0]
+            _data_cache_stats['misses'] += 1
+        count('data_cache_misses')
+        value = func(*args, **kwargs)
+        size = _result_bytes(value)
+        with _data_cache_lock:
+            if version == _data_cache_version and size <= data_cache_max_bytes and key not in _data_cache:
+                _data_cache[key] = (value, size)
+                _data_cache_bytes += size
+                while len(_data_cache) > data_cache_max_entries or _data_cache_bytes > data_cache_max_bytes:
+                    _data_cache_bytes -= _data_cache.popitem(last=False)[1][1]
+                    _data_cache_stats['evictions'] += 1
+        return value
+    return wrapper
+
+def data_cache_stats():
+    with _data_cache_lock:
+        return dict(_data_cache_stats, entries=len(_data_cache), bytes=_data_cache_bytes,
+                    max_entries=data_cache_max_entries, max_bytes=data_cache_max_bytes)
+
+def clear_data_cache():
+    global _data_cache_bytes, _data_cache_version
+    with _data_cache_lock:
+        _data_cache.clear()
+        _data_cache_bytes = 0
+        _data_cache_version = None
+
+@lru_cached
+@timed('db_load')
 def load_stock_data(ticker, days=30):
+    # price_cache があればそこから読む（列は読み取り専用の memory-map）
+    df = price_cache.read_ticker(ticker, days)
+    if df is not None and not df.empty:
+        count('price_cache_hits')
+        return df
+    # days=None なら全期間を読み込む（SQLite の LIMIT -1 は上限なし）
     query = text(f"SELECT date, open, high, low, close, adj_close, volume FROM stock_data WHERE ticker=:ticker ORDER BY date DESC LIMIT :days")
     with engine.connect() as conn:
-        result = conn.execute(query, {'ticker': ticker, 'days': days})
+        result = conn.execute(query, {'ticker': ticker, 'days': -1 if days is None else days})
         data = result.fetchall()
         if not data:
             logging.error(f"No data found for ticker {ticker}")
@@ -25,6 +298,49 @@ def load_stock_data(ticker, days=30):
         logging.info(f"Loaded data from database for ticker {ticker}")
         return df
 
+@timed('db_load')
+def load_stock_data_many(tickers, days=30, compact=False):
+    """複数銘柄の直近 days 日（None なら全期間）の日足を load_chunk_size 銘柄ごとに1回のクエリで読み込む。
+
+    (ticker, date) の MultiIndex で ticker, date の昇順に並んだ DataFrame を返す（列は load_stock_data と同じ）。
+    compact なら DataFrame を作らずに CompactPanel（0.1円単位の int32 の価格など）を返す。データのない銘柄は含まない。
+    """
+    columns = 'ticker, date, open, high, low, close, adj_close, volume'
+    tickers = list(dict.fromkeys(tickers))
+    data = []
+    # 行数が多いので SQLAlchemy の Row を介さず DBAPI のカーソルで読む
+    raw_connection = engine.raw_connection()
+    try:
+        cursor = raw_connection.cursor()
+        for start in range(0, len(tickers), load_chunk_size):
+            chunk = tickers[start:start + load_chunk_size]
+            if days is None:
+                cursor.execute(f"SELECT {columns} FROM stock_data WHERE ticker IN ({', '.join('?' * len(chunk))})", chunk)
+            else:
+                # 銘柄ごとに主キー (ticker, date) を新しい方から days 行だけ読むクエリを UNION ALL でつなぐ
+                seek = f"SELECT * FROM (SELECT {columns} FROM stock_data WHERE ticker=? ORDER BY date DESC LIMIT ?)"
+                cursor.execute(" UNION ALL ".join([seek] * len(chunk)), [value for ticker in chunk for value in (ticker, days)])
+            data.extend(cursor.fetchall())
+        cursor.close()
+    finally:
+        raw_connection.close()
+    if compact:
+        ticker_values, dates, *prices, volume = zip(*data) if data else ((),) * 8
+        columns = dict(zip(price_cache.price_columns, prices), volume=[v or 0 for v in volume])
+        panel = CompactPanel.from_arrays(list(ticker_values), list(dates), columns)
+        logging.info(f"Loaded compact data from database for {len(panel)} tickers")
+        return panel
+    df = pd.DataFrame(data, columns=['ticker', 'date', 'open', 'high', 'low', 'close', 'adj_close', 'volume'])
+    df['date'] = pd.to_datetime(df['date'])
+    df.set_index(['ticker', 'date'], inplace=True)
+    df.sort_index(inplace=True)
+    found = df.index.get_level_values('ticker').nunique()
+    if found < len(tickers):
+        logging.warning(f"No data found for {len(tickers) - found} of {len(tickers)} tickers")
+    logging.info(f"Loaded data from database for {found} tickers")
+    return df
+
+@lru_cached
 def check_ticker_symbol(ticker):
     query = text("SELECT EXISTS(SELECT 1 FROM stock_data WHERE ticker=:ticker)")
     with engine.connect() as conn:
@@ -0,0 +1,204 @@
+'''market_data.py'''
+import time
+import zlib
+import queue
+import random
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+from models.database import insert_chunk_size, stock_rows, upsert_stock_data
+
+# yf.download の列名を stock_data の列名にする
+column_names = {'Date': 'date', 'Open': 'open', 'High': 'high', 'Low': 'low', 'Close': 'close', 'Adj Close': 'adj_close', 'Volume': 'volume'}
+
+def yfinance_source():
+    # yfinance は実際にダウンロードするときだけ読み込む（偽のデータソースで動かすときは不要）
+    import yfinance
+    return yfinance
+
+class FakeDataSource:
+    """ネットワークを使わずに yf.download と同じ形の日足（幾何ランダムウォーク）を返すデータソース。
+
+    latency 秒待ってから返し、failure_rate の割合で例外を投げる（再試行の確認用）。missing の銘柄はデータなしになる。
+    """
+
+    def __init__(self, latency=0.0, failure_rate=0.0, missing=(), seed=0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.missing = set(missing)
+        self.seed = seed
+        self.calls = 0
+        self.lock = threading.Lock()
+        self.rng = random.Random(seed)
+
+    def download(self, tickers, start=None, end=None, interval='1d', group_by='column', **kwargs):
+        with self.lock:
+            self.calls += 1
+            fail = self.rng.random() < self.failure_rate
+        time.sleep(self.latency)
+        if fail:
+            raise ConnectionError("Simulated download failure")
+        yf_tickers = tickers.split() if isinstance(tickers, str) else list(tickers)
+        index = pd.bdate_range(start, end, inclusive='left', name='Date')
+        frames = {}
+        for yf_ticker in yf_tickers:
+            if yf_ticker.split('.')[0] in self.missing:
+                continue
+            rng = np.random.default_rng([self.seed, zlib.crc32(yf_ticker.encode())])
+            close = np.round(400.0 * np.exp(np.cumsum(rng.normal(0, 0.03, len(index)))), 1)
+            open_ = np.concatenate(([400.0], close[:-1]))
+            frames[yf_ticker] = pd.DataFrame({'Open': open_, 'High': np.maximum(open_, close), 'Low': np.minimum(open_, close), 'Close': close,
+                                              'Adj Close': close, 'Volume': rng.integers(100, 100000, len(index)) * 100}, index=index)
+        if not frames:
+            return pd.DataFrame()
+        data = pd.concat(frames, axis=1)
+        return data if group_by == 'ticker' else data.swaplevel(axis=1)
+
+class TokenBucket:
+    """1秒あたり rate 回、最大 capacity 回まで続けて acquire() できるレート制限（スレッド間で共有する）。"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+def split_download(data, yf_tickers):
+    """複数銘柄の yf.download の結果（列が (銘柄, 項目) の MultiIndex）を銘柄ごとの DataFrame に分ける。
+
+    データのない日（全項目が NaN）は除く。1銘柄だけのときは列が MultiIndex でないこともある。
+    """
+    frames = {}
+    if data is None or data.empty:
+        return frames
+    for yf_ticker in yf_tickers:
+        if isinstance(data.columns, pd.MultiIndex):
+            if yf_ticker not in data.columns.get_level_values(0):
+                continue
+            frame = data[yf_ticker]
+        elif len(yf_tickers) == 1:
+            frame = data
+        else:
+            continue
+        frame = frame.dropna(how='all')
+        if frame.empty:
+            continue
+        frame = frame.reset_index().rename(columns=column_names)
+        if 'adj_close' not in frame.columns:
+            frame['adj_close'] = frame['close']
+        frames[yf_ticker] = frame
+    return frames
+
+class MarketDataDownloader:
+    """日足を複数スレッドでまとめてダウンロードし、1つの書き込みスレッドで stock_data にまとめて書き込む。
+
+    source は yf.download と同じ引数の download() を持つもの（既定は yfinance。試験では偽のデータソースを渡す）。
+    """
+
+    def __init__(self, source=None, workers=4, batch_size=50, rate=1.0, burst=None, retries=3, backoff=2.0):
+        self.source = source
+        self.workers = workers
+        self.batch_size = batch_size
+        self.rate_limiter = TokenBucket(rate, burst)
+        self.retries = retries
+        self.backoff = backoff
+
+    def download(self, yf_tickers, start_date, end_date):
+        """レート制限を守って yf.download を呼び、失敗したら backoff * 2^n 秒（揺らぎつき）待って retries 回まで再試行する。"""
+        source = self.source or yfinance_source()
+        for attempt in range(self.retries + 1):
+            self.rate_limiter.acquire()
+            try:
+                return source.download(yf_tickers, start=start_date, end=end_date, interval='1d', group_by='ticker',
+                                       auto_adjust=False, threads=False, progress=False)
+            except Exception as e:
+                if attempt == self.retries:
+                    raise
+                wait = self.backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+                logging.warning("Download failed for %s tickers (%s), retrying in %.1f seconds", len(yf_tickers), e, wait)
+                time.sleep(wait)
+
+    def _fetch_batch(self, batch, start_date, end_date, output):
+        yf_tickers = [f"{ticker}.T" for ticker in batch]
+        frames = split_download(self.download(yf_tickers, start_date, end_date), yf_tickers)
+        found = 0
+        for ticker, yf_ticker in zip(batch, yf_tickers):
+            frame = frames.get(yf_ticker)
+            if frame is not None:
+                output.put(stock_rows(ticker, frame))
+                found += 1
+        return found
+
+    def _write(self, output, stats):
+        # 書き込みはこのスレッドだけが行い、insert_chunk_size 行たまるごとにまとめて書き込む
+        pending = []
+        rows = None
+        try:
+            while True:
+                rows = output.get()
+                if rows is None:
+                    break
+                pending.extend(rows)
+                if len(pending) >= insert_chunk_size:
+                    stats['rows'] += upsert_stock_data(pending)
+                    pending = []
+            if pending:
+                stats['rows'] += upsert_stock_data(pending)
+        except Exception as e:
+            stats['write_error'] = e
+            # ダウンロード側のスレッドが put() で止まらないように残りを読み捨てる
+            while rows is not None:
+                rows = output.get()
+
+    def run(self, jobs):
+        """jobs は (ticker, start_date, end_date) のリスト。同じ期間の銘柄を batch_size 件ずつまとめてダウンロードする。"""
+        started = time.perf_counter()
+        periods = OrderedDict()
+        for ticker, start_date, end_date in jobs:
+            periods.setdefault((start_date, end_date), []).append(ticker)
+        batches = [(tickers[i:i + self.batch_size], start_date, end_date)
+                   for (start_date, end_date), tickers in periods.items() for i in range(0, len(tickers), self.batch_size)]
+
+        stats = {'tickers': len(jobs), 'batches': len(batches), 'tickers_with_data': 0, 'rows': 0, 'failed': []}
+        output = queue.Queue(maxsize=self.workers * 2)
+        writer = threading.Thread(target=self._write, args=(output, stats), name='stock-data-writer')
+        writer.start()
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                futures = {executor.submit(self._fetch_batch, batch, start_date, end_date, output): (batch, start_date, end_date)
+                           for batch, start_date, end_date in batches}
+                for future in as_completed(futures):
+                    batch, start_date, end_date = futures[future]
+                    try:
+                        found = future.result()
+                    except Exception as e:
+                        logging.error("Failed to download %s tickers (%s ... %s) from %s to %s: %s", len(batch), batch[0], batch[-1], start_date, end_date, e)
+                        stats['failed'].extend(batch)
+                        continue
+                    stats['tickers_with_data'] += found
+                    if found < len(batch):
+                        logging.warning("No data found for %s of %s tickers from %s to %s", len(batch) - found, len(batch), start_date, end_date)
+                    logging.info("Downloaded %s tickers from %s to %s", found, start_date, end_date)
+        finally:
+            output.put(None)
+            writer.join()
+        if 'write_error' in stats:
+            raise stats.pop('write_error')
+        stats['seconds'] = time.perf_counter() - started
+        return stats
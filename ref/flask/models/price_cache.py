@@ -0,0 +1,54 @@
+'''price_cache.py'''
+import os
+import numpy as np
+import pandas as pd
+
+# 銘柄ごとの日足を1つの .npy（int64 の 7 x 日数の配列）に保存し、np.load(mmap_mode='r') で読み込む。
+# 行は date（datetime64[us] の値）、open/high/low/close/adj_close（float64 のビット列）、volume の順
+cache_dir = os.path.join(os.getcwd(), 'price_cache')
+price_columns = ['open', 'high', 'low', 'close', 'adj_close']
+
+def cache_path(ticker):
+    return os.path.join(cache_dir, f"{ticker}.npy")
+
+def write_ticker(ticker, dates, prices, volume):
+    """日付の昇順に並んだ dates（datetime64）, prices（5 x 日数の float64）, volume を書き込む。"""
+    data = np.empty((7, len(dates)), dtype='int64')
+    data[0] = np.asarray(dates, dtype='datetime64[us]').view('int64')
+    data[1:6] = np.ascontiguousarray(prices, dtype='float64').view('int64')
+    data[6] = volume
+    os.makedirs(cache_dir, exist_ok=True)
+    # 読み込み中のプロセスが壊れたファイルを見ないように一時ファイルに書いてから置き換える
+    filename = cache_path(ticker)
+    with open(filename + '.tmp', 'wb') as f:
+        np.save(f, data)
+    os.replace(filename + '.tmp', filename)
+
+def read_ticker(ticker, days=None):
+    """キャッシュから直近 days 日（None なら全期間）の日足を返す。キャッシュがなければ None。
+
+    列はファイルを memory-map した配列のスライス（コピーしない）なので読み取り専用。
+    """
+    try:
+        data = np.asarray(np.load(cache_path(ticker), mmap_mode='r'))  # np.memmap ではなく同じメモリを指す ndarray にする
+    except FileNotFoundError:
+        return None
+    start = 0 if days is None else max(data.shape[1] - days, 0)
+    prices = data[1:6, start:].view('float64')
+    columns = {name: prices[i] for i, name in enumerate(price_columns)}
+    columns['volume'] = data[6, start:]
+    index = pd.DatetimeIndex(data[0, start:].view('datetime64[us]'), name='date')
+    return pd.DataFrame(columns, index=index, copy=False)
+
+def cached_tickers():
+    if not os.path.isdir(cache_dir):
+        return set()
+    return {name[:-4] for name in os.listdir(cache_dir) if name.endswith('.npy')}
+
+def invalidate(tickers):
+    # stock_data を書き換えた銘柄のキャッシュを消す（次の rebuild_price_cache() で作り直す）
+    for ticker in tickers:
+        try:
+            os.remove(cache_path(ticker))
+        except FileNotFoundError:
+            pass
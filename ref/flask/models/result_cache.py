@@ -0,0 +1,118 @@
+'''result_cache.py'''
+import os
+import time
+import logging
+from sqlalchemy import create_engine, text
+from utils.instrumentation import count
+
+# バックテスト結果のキャッシュ（価格データのハッシュ・戦略のバージョン・初期資金・パラメータをキーにする）
+cache_db_filename = 'backtest_cache.db'
+cache_db_path = os.path.join(os.getcwd(), cache_db_filename)
+cache_engine = create_engine(f'sqlite:///{cache_db_path}', connect_args={'timeout': 30})
+
+# 保持する結果の件数の上限（超えたら最後に使われたのが古いものから evict_to の割合まで削除する）
+max_cache_entries = 1000000
+evict_to = 0.9
+# 件数はプロセス内で足し上げた概算で判断し、他のプロセスの書き込みの分を拾うために store_results() の count_interval 回ごとに数え直す
+count_interval = 100
+
+_stats = {'hits': 0, 'misses': 0}
+_table_ready = False
+_entries_estimate = None
+_stores_since_count = 0
+
+def _ensure_table(conn):
+    global _table_ready
+    if _table_ready:
+        return
+    conn.execute(text("""
+    CREATE TABLE IF NOT EXISTS backtest_cache (
+        ticker TEXT NOT NULL,
+        data_hash TEXT NOT NULL,
+        strategy_version TEXT NOT NULL,
+        initial_capital REAL NOT NULL,
+        upper_limit REAL NOT NULL,
+        lower_limit REAL NOT NULL,
+        final_value REAL,
+        profit_loss REAL,
+        trades_executed INTEGER,
+        last_used REAL,
+        PRIMARY KEY (ticker, data_hash, strategy_version, initial_capital, upper_limit, lower_limit)
+    )
+    """))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_backtest_cache_last_used ON backtest_cache (last_used)"))
+    _table_ready = True
+
+def lookup_results(ticker, data_hash, strategy_version, initial_capital, param_combinations):
+    """キャッシュ済みの結果を {(upper_limit, lower_limit): (final_value, profit_loss, trades_executed)} で返す。"""
+    wanted = set(param_combinations)
+    with cache_engine.begin() as conn:
+        _ensure_table(conn)
+        rows = conn.execute(text("""
+        SELECT upper_limit, lower_limit, final_value, profit_loss, trades_executed FROM backtest_cache
+        WHERE ticker=:ticker AND data_hash=:data_hash AND strategy_version=:strategy_version AND initial_capital=:initial_capital
+        """), {'ticker': ticker, 'data_hash': data_hash, 'strategy_version': strategy_version,
+               'initial_capital': initial_capital}).fetchall()
+        found = {(row[0], row[1]): (row[2], row[3], bool(row[4])) for row in rows if (row[0], row[1]) in wanted}
+        if found:
+            conn.execute(text("""
+            UPDATE backtest_cache SET last_used=:last_used
+            WHERE ticker=:ticker AND data_hash=:data_hash AND strategy_version=:strategy_version AND initial_capital=:initial_capital
+            """), {'last_used': time.time(), 'ticker': ticker, 'data_hash': data_hash,
+                   'strategy_version': strategy_version, 'initial_capital': initial_capital})
+
+    _stats['hits'] += len(found)
+    _stats['misses'] += len(wanted) - len(found)
+    count('result_cache_hits', len(found))
+    count('result_cache_misses', len(wanted) - len(found))
+    return found
+
+def store_results(ticker, data_hash, strategy_version, initial_capital, results):
+    # results は {(upper_limit, lower_limit): (final_value, profit_loss, trades_executed)}
+    if not results:
+        return
+    now = time.time()
+    rows = [{'ticker': ticker, 'data_hash': data_hash, 'strategy_version': strategy_version,
+             'initial_capital': initial_capital, 'upper_limit': upper_limit, 'lower_limit': lower_limit,
+             'final_value': final_value, 'profit_loss': profit_loss, 'trades_executed': int(trades_executed),
+             'last_used': now}
+            for (upper_limit, lower_limit), (final_value, profit_loss, trades_executed) in results.items()]
+    with cache_engine.begin() as conn:
+        _ensure_table(conn)
+        conn.execute(text("""
+        INSERT OR REPLACE INTO backtest_cache
+            (ticker, data_hash, strategy_version, initial_capital, upper_limit, lower_limit, final_value, profit_loss, trades_executed, last_used)
+        VALUES (:ticker, :data_hash, :strategy_version, :initial_capital, :upper_limit, :lower_limit, :final_value, :profit_loss, :trades_executed, :last_used)
+        """), rows)
+        _evict(conn, len(rows))
+
+def _evict(conn, inserted):
+    # COUNT(*) は全件を数えるので毎回は実行しない（INSERT OR REPLACE の置き換え分も足すので概算は多めになる）
+    global _entries_estimate, _stores_since_count
+    _stores_since_count += 1
+    if _entries_estimate is not None:
+        _entries_estimate += inserted
+        if _entries_estimate <= max_cache_entries and _stores_since_count < count_interval:
+            return
+    entries = conn.execute(text("SELECT COUNT(*) FROM backtest_cache")).scalar()
+    _stores_since_count = 0
+    if entries > max_cache_entries:
+        excess = entries - int(max_cache_entries * evict_to)
+        conn.execute(text("""
+        DELETE FROM backtest_cache WHERE rowid IN (
+            SELECT rowid FROM backtest_cache ORDER BY last_used LIMIT :excess
+        )
+        """), {'excess': excess})
+        logging.info("Evicted %s entries from the backtest cache", excess)
+        entries -= excess
+    _entries_estimate = entries
+
+def cache_stats():
+    return dict(_stats)
+
+def reset_cache_stats():
+    _stats['hits'] = _stats['misses'] = 0
+
+# プロセスプールのワーカー起動時に呼び、fork元の接続を使わずワーカーごとに接続を開き直す
+def dispose_cache_engine():
+    cache_engine.dispose(close=False)
@@ -0,0 +1,86 @@
+'''indicator_cache.py'''
+import hashlib
+import logging
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from config.vars import short_term_window, long_term_window
+from utils.indicators import MovingAverages
+from utils.instrumentation import timed, stage, count
+
+# 保持する銘柄×データ×期間の組み合わせの上限
+max_cache_entries = 256
+
+_cache = OrderedDict()
+_stats = {'hits': 0, 'misses': 0}
+
+def data_version(df):
+    # 日付と終値が同じなら同じ値になるハッシュ（DBの更新でデータが変われば別のキーになる）
+    digest = hashlib.sha1()
+    digest.update(np.ascontiguousarray(df.index.asi8).tobytes())
+    digest.update(np.ascontiguousarray(df['close'].to_numpy(dtype=np.float64)).tobytes())
+    return digest.hexdigest()
+
+def is_daily(index):
+    # stock_data は取り込み時に日足になっている（1日1行・時刻は0時）ので resample しなくてよい
+    if index.tz is not None or not (index.is_unique and index.is_monotonic_increasing):
+        return False
+    values = index.to_numpy()
+    return bool((values.astype('datetime64[D]') == values).all())
+
+@timed('daily_resample')
+def load_daily_close(df):
+    try:
+        if isinstance(df.index, pd.DatetimeIndex) and is_daily(df.index):
+            return df['close'].dropna()
+        daily_df = df.resample('D').agg({'close': 'last'}).dropna()
+        return daily_df['close']
+    except Exception as e:
+        logging.error(f"Error loading daily prices: {e}")
+        return pd.Series(dtype='float64')
+
+def load_daily_prices(df):
+    return load_daily_close(df).tolist()
+
+class TickerIndicators:
+    """1銘柄分の日足終値と移動平均。パラメータに依存しないので全バックテストで共有する（読み取り専用）。"""
+
+    def __init__(self, daily_close, short_window, long_window):
+        self.daily_dates = daily_close.index
+        self.daily_prices = daily_close.tolist()
+        self.short_window = short_window
+        self.long_window = long_window
+        self.moving_averages = MovingAverages(short_window, long_window, self.daily_prices)
+        self.short_term_ma = self._moving_average_array(short_window)
+        self.long_term_ma = self._moving_average_array(long_window)
+
+    def _moving_average_array(self, window):
+        if len(self.daily_prices) < window:
+            return None
+        return np.convolve(self.daily_prices, np.ones(window), 'valid') / window
+
+def get_indicators(ticker, df, short_window=short_term_window, long_window=long_term_window):
+    key = (ticker, data_version(df), short_window, long_window)
+    indicators = _cache.get(key)
+    if indicators is not None:
+        _cache.move_to_end(key)
+        _stats['hits'] += 1
+        count('indicator_cache_hits')
+        return indicators
+
+    _stats['misses'] += 1
+    count('indicator_cache_misses')
+    daily_close = load_daily_close(df)
+    with stage('indicators'):
+        indicators = TickerIndicators(daily_close, short_window, long_window)
+    _cache[key] = indicators
+    if len(_cache) > max_cache_entries:
+        _cache.popitem(last=False)
+    return indicators
+
+def cache_stats():
+    return dict(_stats, entries=len(_cache))
+
+def clear_cache():
+    _cache.clear()
+    _stats['hits'] = _stats['misses'] = 0
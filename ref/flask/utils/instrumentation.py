@@ -0,0 +1,109 @@
+'''instrumentation.py'''
+import os
+import json
+import time
+import datetime
+import functools
+import tracemalloc
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# 既定では無効。enable() するまで stage() / count() はほとんど何もしないので本番のコードに入れたままでよい
+_enabled = False
+_trace_memory = False
+_stages = OrderedDict()
+_counters = OrderedDict()
+
+def enable(trace_memory=False):
+    global _enabled, _trace_memory
+    _enabled = True
+    _trace_memory = trace_memory
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+def disable():
+    global _enabled, _trace_memory
+    _enabled = False
+    if _trace_memory and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    _trace_memory = False
+
+def is_enabled():
+    return _enabled
+
+def is_tracing_memory():
+    return _trace_memory
+
+def reset():
+    _stages.clear()
+    _counters.clear()
+
+@contextmanager
+def stage(name):
+    """ブロックの経過時間・CPU時間（trace_memory なら確保したメモリの増分も）を name ごとに合計する。
+
+    入れ子にした場合、外側の stage には内側の時間も含まれる。
+    """
+    if not _enabled:
+        yield
+        return
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    memory_start = tracemalloc.get_traced_memory()[0] if _trace_memory else None
+    try:
+        yield
+    finally:
+        totals = _stages.get(name)
+        if totals is None:
+            totals = _stages[name] = {'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0}
+        totals['calls'] += 1
+        totals['wall_seconds'] += time.perf_counter() - wall_start
+        totals['cpu_seconds'] += time.process_time() - cpu_start
+        if memory_start is not None:
+            totals['allocated_bytes'] = totals.get('allocated_bytes', 0) + tracemalloc.get_traced_memory()[0] - memory_start
+
+def timed(name):
+    # 関数全体を stage(name) で囲むデコレータ
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def count(name, n=1):
+    if _enabled:
+        _counters[name] = _counters.get(name, 0) + n
+
+def summary(top_allocations=10):
+    result = {'stages': {name: dict(totals) for name, totals in _stages.items()}, 'counters': dict(_counters)}
+    if _trace_memory and tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        result['memory'] = {'current_bytes': current, 'peak_bytes': peak}
+        if top_allocations:
+            statistics = tracemalloc.take_snapshot().statistics('lineno')[:top_allocations]
+            result['memory']['top_allocations'] = [{'location': str(stat.traceback), 'size_bytes': stat.size, 'count': stat.count} for stat in statistics]
+    return result
+
+def merge(other):
+    # プロセスプールのワーカーで取った summary() を合算する（時間は全ワーカーの合計になる）
+    if not _enabled or not other:
+        return
+    for name, totals in other['stages'].items():
+        merged = _stages.setdefault(name, {'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0})
+        for key, value in totals.items():
+            merged[key] = merged.get(key, 0) + value
+    for name, value in other['counters'].items():
+        _counters[name] = _counters.get(name, 0) + value
+
+def default_summary_path(name, log_dir='instrumentation_log'):
+    return os.path.join(log_dir, f'{name}_{datetime.datetime.now().strftime("%Y%m%d%H%M%S")}.json')
+
+def write_summary(filename, **info):
+    """実行1回分の summary() に info（コマンド名・件数など）を加えて JSON に書き出す。"""
+    data = {'created_at': datetime.datetime.now().isoformat(timespec='seconds'), **info, **summary()}
+    if os.path.dirname(filename):
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+    with open(filename, 'w') as f:
+        json.dump(data, f, indent=2, default=str)
+    return filename
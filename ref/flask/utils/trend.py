@@ -1,11 +1,12 @@
 import pandas as pd
-from controllers.trade import TradeController
-from config.vars import initial_capital, short_term_window, long_term_window
+from utils.indicator_cache import get_indicators
 
-def determine_trend(prices):
-    trade_controller = TradeController(pd.DataFrame(prices), "", initial_capital)
-    short_term_ma = trade_controller.calculate_moving_average(prices, short_term_window)
-    long_term_ma = trade_controller.calculate_moving_average(prices, long_term_window)
+def determine_trend(prices, indicators=None):
+    # 移動平均は process_ticker で計算済みのものを受け取る（なければキャッシュから取得）
+    if indicators is None:
+        indicators = get_indicators("", pd.DataFrame(prices))
+    short_term_ma = indicators.short_term_ma
+    long_term_ma = indicators.long_term_ma
 
     if short_term_ma is None or long_term_ma is None:
         return "データが不足しています"
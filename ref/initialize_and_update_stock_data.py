@@ -1,117 +1,98 @@
-import yfinance as yf
+import argparse
 import pandas as pd
 import datetime
-import sqlite3
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 import logging
-import os
-from time import sleep
+from models.database import engine, migrate, rebuild_price_cache, bump_data_version
+from models.market_data import MarketDataDownloader, FakeDataSource
+from models import ticker_universe
 
 # ログの設定
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# データベースの設定
-db_filename = 'stock_data.db'
-db_path = os.path.join(os.getcwd(), db_filename)
-engine = create_engine(f'sqlite:///{db_path}', echo=True)
-
 # 証券コードのCSVファイルから読み込み
 def load_ticker_symbols(csv_filename):
     df = pd.read_csv(csv_filename, encoding='utf-8-sig')
     return df['ticker_symbol'].astype(str).tolist()
 
-# テーブルを作成する関数
+# 取得する銘柄を決める関数（CSV の指定がなければ get_all_ticker_symbols.py が保存したユニバース）
+def select_ticker_symbols(csv_filename, changed_only=False):
+    if changed_only:
+        diff = ticker_universe.load_diff()
+        if diff['removed']:
+            logger.info(f"{len(diff['removed'])} tickers were removed from the universe: {', '.join(diff['removed'])}")
+        return diff['added']
+    if csv_filename:
+        return load_ticker_symbols(csv_filename)
+    codes = ticker_universe.load_universe()
+    return codes.tolist() if codes is not None else load_ticker_symbols(ticker_universe.csv_path)
+
+# テーブルを作成し、既存のDBは最新のスキーマ（(ticker, date) が主キー）に移行する関数
 def create_table():
-    with engine.connect() as conn:
-        conn.execute(text("""
-        CREATE TABLE IF NOT EXISTS stock_data (
-            id INTEGER PRIMARY KEY,
-            ticker TEXT,
-            date DATE,
-            open REAL,
-            high REAL,
-            low REAL,
-            close REAL,
-            adj_close REAL,
-            volume INTEGER
-        )
-        """))
-        logger.info("Table created successfully.")
+    version = migrate()
+    logger.info(f"Table created successfully (schema version {version}).")
 
-# 最終更新日を取得する関数
-def get_last_update_date(ticker):
-    query = text(f"SELECT MAX(date) FROM stock_data WHERE ticker=:ticker")
+# 銘柄ごとの最終更新日を1回のクエリで取得する関数
+def get_last_update_dates():
+    query = text("SELECT ticker, MAX(date) FROM stock_data GROUP BY ticker")
     with engine.connect() as conn:
-        result = conn.execute(query, {'ticker': ticker}).fetchone()
-        last_date = result[0]
-        if last_date:
-            last_date = datetime.datetime.strptime(last_date, '%Y-%m-%d')
-        return last_date
-
-# 株価データを取得してデータベースに保存する関数
-def fetch_and_store_stock_data(ticker, start_date, end_date):
-    try:
-        yf_ticker = f"{ticker}.T"
-        data = yf.download(yf_ticker, start=start_date, end=end_date, interval='1d')
-        if data.empty:
-            logger.warning(f"No data found for ticker {ticker} from {start_date} to {end_date}")
-            return
+        return {ticker: datetime.datetime.strptime(last_date, '%Y-%m-%d') for ticker, last_date in conn.execute(query) if last_date}
 
-        data.reset_index(inplace=True)
-        data['ticker'] = ticker
-        data.rename(columns={
-            'Date': 'date',
-            'Open': 'open',
-            'High': 'high',
-            'Low': 'low',
-            'Close': 'close',
-            'Adj Close': 'adj_close',
-            'Volume': 'volume'
-        }, inplace=True)
+# 銘柄ごとの取得期間 (ticker, start_date, end_date) を決める関数（最新の銘柄は除く）
+def download_jobs(ticker_symbols, end_date):
+    last_update_dates = get_last_update_dates()
+    jobs = []
+    for ticker in ticker_symbols:
+        last_update_date = last_update_dates.get(ticker)
+        if last_update_date:
+            start_date = last_update_date + datetime.timedelta(days=1)
+        else:
+            start_date = end_date - datetime.timedelta(days=100)  # データがない場合は過去100日分取得
+        if start_date.date() >= end_date.date():
+            continue
+        jobs.append((ticker, start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')))
+    return jobs
 
-        with engine.begin() as conn:
-            for index, row in data.iterrows():
-                conn.execute(text("""
-                INSERT INTO stock_data (ticker, date, open, high, low, close, adj_close, volume)
-                VALUES (:ticker, :date, :open, :high, :low, :close, :adj_close, :volume)
-                """), {
-                    'ticker': row['ticker'],
-                    'date': row['date'].strftime('%Y-%m-%d'),
-                    'open': row['open'],
-                    'high': row['high'],
-                    'low': row['low'],
-                    'close': row['close'],
-                    'adj_close': row['adj_close'],
-                    'volume': row['volume']
-                })
-        logger.info(f"Data for ticker {ticker} from {start_date} to {end_date} inserted successfully.")
-        
-    except Exception as e:
-        logger.error(f"Error fetching data for ticker {ticker}: {e}")
+def parse_args():
+    parser = argparse.ArgumentParser(description="証券コード一覧の銘柄の日足をダウンロードして stock_data を更新する")
+    parser.add_argument('--tickers-csv', help="証券コードのCSVファイル。省略時は保存済みのユニバース（tickersymbolslist/tokyo_ticker_symbols.npy）")
+    parser.add_argument('--changed-only', action='store_true', help="前回のユニバースの更新で追加された銘柄だけを取得する")
+    parser.add_argument('--workers', type=int, default=4, help="同時にダウンロードするスレッド数")
+    parser.add_argument('--batch-size', type=int, default=50, help="1回の yf.download で取得する銘柄数")
+    parser.add_argument('--rate', type=float, default=1.0, help="1秒あたりの yf.download の呼び出し回数の上限")
+    parser.add_argument('--retries', type=int, default=3, help="失敗したときの再試行回数")
+    parser.add_argument('--fake-source', action='store_true', help="yfinance の代わりに合成データを返す偽のデータソースを使う（オフラインでの確認用）")
+    parser.add_argument('--fake-latency', type=float, default=0.0, help="偽のデータソースの1回あたりの待ち時間（秒）")
+    return parser.parse_args()
 
 # メイン処理
 def main():
-    # 証券コードのCSVファイルパスを指定
-    csv_path = os.path.join("tickersymbolslist", 'tokyo_ticker_symbols.csv')
-    ticker_symbols = load_ticker_symbols(csv_path)
-    
+    args = parse_args()
+    ticker_symbols = select_ticker_symbols(args.tickers_csv, args.changed_only)
+
     create_table()
-    
+
     end_date = datetime.datetime.now()
-    
-    for ticker in ticker_symbols:
-        last_update_date = get_last_update_date(ticker)
-        if last_update_date:
-            start_date = last_update_date + datetime.timedelta(days=1)
-        else:
-            start_date = end_date - datetime.timedelta(days=100)  # データがない場合は過去100日分取得
+    jobs = download_jobs(ticker_symbols, end_date)
+    logger.info(f"{len(jobs)} of {len(ticker_symbols)} tickers need updating.")
 
+    source = FakeDataSource(latency=args.fake_latency) if args.fake_source else None
+    downloader = MarketDataDownloader(source, workers=args.workers, batch_size=args.batch_size, rate=args.rate, retries=args.retries)
+    # run() が例外（書き込みの失敗や Ctrl-C）で止まっても、それまでに書き込んだ銘柄はあるので
+    # 書き換えた銘柄（と未作成の銘柄）の price_cache を作り直し、データの版を上げて各プロセスの LRU を必ず捨てさせる
+    try:
+        stats = downloader.run(jobs)
+        logger.info(f"Stored {stats['rows']} rows for {stats['tickers_with_data']} tickers in {stats['batches']} downloads "
+                    f"({stats['seconds']:.1f} seconds).")
+        if stats['failed']:
+            logger.error(f"Failed to download {len(stats['failed'])} tickers: {', '.join(stats['failed'])}")
+    finally:
         try:
-            fetch_and_store_stock_data(ticker, start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d'))
-        except Exception as e:
-            logger.error(f"Failed to fetch or store data for ticker {ticker}: {e}")
-        sleep(1)  # API制限を避けるために待機
+            rebuild_price_cache()
+        finally:
+            version = bump_data_version()
+            logger.info(f"Stock data version is now {version}.")
 
 if __name__ == "__main__":
     main()
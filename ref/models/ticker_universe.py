@@ -0,0 +1,124 @@
+'''ticker_universe.py'''
+import os
+import json
+import hashlib
+import logging
+import datetime
+import numpy as np
+import pandas as pd
+import requests
+
+# 財務省の上場企業の銘柄リスト（list.xlsx）から証券コードの一覧（ユニバース）を作る。
+# 前回の ETag / Last-Modified を送って変わっていなければダウンロードせず、内容のハッシュが同じなら Excel を読まない
+url = 'https://www.mof.go.jp/policy/international_policy/gaitame_kawase/fdi/list.xlsx'
+sheet_name = '上場企業の銘柄リスト'
+code_column = '証券コード\n(Securities code)'
+universe_dir = "tickersymbolslist"
+xlsx_path = os.path.join(universe_dir, 'list.xlsx')
+# ETag, Last-Modified, ハッシュを保存するファイル
+state_path = os.path.join(universe_dir, 'list_state.json')
+# 証券コードの昇順の配列（np.load で読める）、前回からの追加・削除、従来の CSV
+universe_path = os.path.join(universe_dir, 'tokyo_ticker_symbols.npy')
+diff_path = os.path.join(universe_dir, 'universe_diff.json')
+csv_path = os.path.join(universe_dir, 'tokyo_ticker_symbols.csv')
+request_timeout = 60
+
+def _read_json(filename):
+    try:
+        with open(filename, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def _write_atomic(filename, write):
+    # 途中で止まっても壊れたファイルが残らないように一時ファイルに書いてから置き換える
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    with open(filename + '.tmp', 'wb') as f:
+        write(f)
+    os.replace(filename + '.tmp', filename)
+
+def _write_json(filename, data):
+    _write_atomic(filename, lambda f: f.write(json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')))
+
+def fetch(url=url, state=None, session=requests):
+    """前回の ETag / Last-Modified を付けて list.xlsx を取得する。変わっていなければ (None, state)、変わっていれば (内容, 新しい state)。"""
+    state = dict(state or {})
+    headers = {}
+    if state.get('etag'):
+        headers['If-None-Match'] = state['etag']
+    if state.get('last_modified'):
+        headers['If-Modified-Since'] = state['last_modified']
+    response = session.get(url, headers=headers, timeout=request_timeout)
+    if response.status_code == 304:
+        return None, state
+    response.raise_for_status()
+    state['etag'] = response.headers.get('ETag')
+    state['last_modified'] = response.headers.get('Last-Modified')
+    return response.content, state
+
+def parse_codes(filename):
+    """ワークブックから銘柄リストのシートの証券コード列だけを読み、重複のない昇順の配列にする。"""
+    df = pd.read_excel(filename, sheet_name=sheet_name, usecols=lambda name: name == code_column, dtype=str)
+    if code_column not in df.columns:
+        raise ValueError(f"証券コード列が見つかりませんでした: {filename}")
+    codes = df[code_column].dropna().str.strip().str.removesuffix('.0')
+    return np.unique(codes[codes != ''].to_numpy(dtype=str))
+
+def load_universe():
+    """保存済みのユニバース（証券コードの昇順の配列）。まだなければ None。"""
+    try:
+        return np.load(universe_path, allow_pickle=False)
+    except FileNotFoundError:
+        return None
+
+def load_diff():
+    """前回の更新で追加・削除された証券コード {'added': [...], 'removed': [...]}。"""
+    diff = _read_json(diff_path)
+    return {'added': diff.get('added', []), 'removed': diff.get('removed', [])}
+
+def _write_diff(added, removed, count):
+    diff = {'added': added, 'removed': removed, 'count': count, 'updated': datetime.datetime.now().isoformat(timespec='seconds')}
+    _write_json(diff_path, diff)
+    return diff
+
+def save_universe(codes):
+    """ユニバースを保存し、前回からの追加・削除を universe_diff.json に書いて返す。"""
+    previous = load_universe()
+    previous = np.array([], dtype=str) if previous is None else previous
+    _write_atomic(universe_path, lambda f: np.save(f, codes, allow_pickle=False))
+    _write_atomic(csv_path, lambda f: pd.DataFrame({'ticker_symbol': codes}).to_csv(f, index=False, encoding='utf-8-sig'))
+    return _write_diff(np.setdiff1d(codes, previous).tolist(), np.setdiff1d(previous, codes).tolist(), len(codes))
+
+def _clear_diff():
+    # 証券コードが変わらなかった更新では追加・削除を空にする（--changed-only が前回の追加分を取得し直さないように）
+    codes = load_universe()
+    _write_diff([], [], 0 if codes is None else len(codes))
+
+def refresh(url=url, session=requests, force=False):
+    """ユニバースを必要なときだけ更新する。
+
+    'status' は not_modified（304）、unchanged（内容のハッシュが同じ）、unchanged_codes（Excel は変わったが証券コードは同じ）、updated のいずれか。
+    updated のときだけ 'added' / 'removed' が入る。
+    """
+    state = {} if force else _read_json(state_path)
+    content, state = fetch(url, state, session)
+    if content is None:
+        _clear_diff()
+        return {'status': 'not_modified'}
+    digest = hashlib.sha256(content).hexdigest()
+    if digest == state.get('sha256') and load_universe() is not None:
+        _write_json(state_path, state)  # ETag だけ変わった場合に次回の条件付き取得で使う
+        _clear_diff()
+        return {'status': 'unchanged'}
+    _write_atomic(xlsx_path, lambda f: f.write(content))
+    codes = parse_codes(xlsx_path)
+    previous = load_universe()
+    if previous is not None and np.array_equal(codes, previous):
+        _clear_diff()
+        result = {'status': 'unchanged_codes'}
+    else:
+        result = dict(save_universe(codes), status='updated')
+    state['sha256'] = digest
+    _write_json(state_path, state)
+    logging.info(f"Ticker universe {result['status']}: {len(codes)} codes")
+    return result
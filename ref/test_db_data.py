@@ -13,11 +13,11 @@ def fetch_data_from_db(ticker=None, limit=5):
     with engine.connect() as conn:
         if ticker:
             query = text(f"""
-            SELECT * FROM stock_data WHERE ticker=:ticker ORDER BY date DESC LIMIT :limit
+            SELECT ticker, date, open, high, low, close, adj_close, volume FROM stock_data WHERE ticker=:ticker ORDER BY date DESC LIMIT :limit
             """)
             result = conn.execute(query, {'ticker': ticker, 'limit': limit})
             data = result.fetchall()
-            df = pd.DataFrame(data, columns=['id', 'ticker', 'date', 'open', 'high', 'low', 'close', 'adj_close', 'volume'])
+            df = pd.DataFrame(data, columns=['ticker', 'date', 'open', 'high', 'low', 'close', 'adj_close', 'volume'])
         else:
             query = text("""
             SELECT DISTINCT ticker FROM stock_data
@@ -0,0 +1,88 @@
+'''compact.py'''
+import numpy as np
+import pandas as pd
+
+# 東証の呼値は最小0.1円なので、価格は0.1円単位の整数（int32）で持てる
+price_scale = 10
+price_columns = ['open', 'high', 'low', 'close', 'adj_close']
+
+def scale_prices(values, lossy=False):
+    """価格を0.1円単位の int32 にする。元の float64 に戻らない値（調整後終値など）があれば lossy なら float32、そうでなければ float64 のまま。"""
+    values = np.asarray(values, dtype=np.float64)
+    scaled = np.rint(values * price_scale)
+    if np.isfinite(values).all() and np.abs(scaled).max(initial=0) < 2 ** 31 and np.array_equal(scaled / price_scale, values):
+        return scaled.astype(np.int32)
+    return values.astype(np.float32) if lossy else values
+
+def unscale_prices(values):
+    # int32 なら0.1円単位から円に戻す（float64 の割り算なので元の値と一致する）
+    if values.dtype == np.int32:
+        return values / price_scale
+    return values.astype(np.float64, copy=False)
+
+def compact_volume(values):
+    values = np.asarray(values, dtype=np.int64)
+    if values.size and (values.max() >= 2 ** 31 or values.min() < -2 ** 31):
+        return values
+    return values.astype(np.int32)
+
+class CompactPanel:
+    """複数銘柄の日足を銘柄ごとに連続した配列（銘柄の順に連結し offsets で区切る）で持つ。
+
+    date は int64 の UNIX 時刻（秒）、価格は scale_prices()、volume は int32、銘柄は tickers への番号で持つ。
+    1銘柄分の取り出しはスライス（コピーしない）で、close() などで float64 に戻す。
+    """
+
+    def __init__(self, tickers, offsets, dates, columns):
+        self.tickers = tickers
+        self.offsets = offsets
+        self.dates = dates
+        self.columns = columns
+        self.positions = {ticker: i for i, ticker in enumerate(tickers)}
+
+    @classmethod
+    def from_arrays(cls, tickers, dates, columns, lossy=False):
+        """銘柄・日付・列ごとの配列（並び順は問わない）から作る。"""
+        ticker_index = pd.Index(tickers)
+        codes, uniques = pd.factorize(ticker_index, sort=True)
+        epoch = np.asarray(dates, dtype='datetime64[s]').view(np.int64)
+        order = np.lexsort((epoch, codes))
+        codes = codes[order]
+        offsets = np.searchsorted(codes, np.arange(len(uniques) + 1)).astype(np.int64)
+        compact = {}
+        for name, values in columns.items():
+            values = np.asarray(values)[order]
+            compact[name] = compact_volume(values) if name == 'volume' else scale_prices(values, lossy)
+        return cls(np.asarray(uniques, dtype=object), offsets, epoch[order], compact)
+
+    @classmethod
+    def from_frame(cls, df, lossy=False):
+        """load_stock_data_many() の (ticker, date) の MultiIndex の DataFrame から作る。"""
+        return cls.from_arrays(df.index.get_level_values('ticker'), df.index.get_level_values('date').to_numpy(),
+                               {name: df[name].to_numpy() for name in df.columns}, lossy)
+
+    def __len__(self):
+        return len(self.tickers)
+
+    @property
+    def nbytes(self):
+        return self.offsets.nbytes + self.dates.nbytes + sum(values.nbytes for values in self.columns.values())
+
+    def ticker_slice(self, ticker):
+        i = self.positions[ticker]
+        return slice(self.offsets[i], self.offsets[i + 1])
+
+    def column(self, ticker, name):
+        values = self.columns[name][self.ticker_slice(ticker)]
+        return values if name == 'volume' else unscale_prices(values)
+
+    def close(self, ticker):
+        return self.column(ticker, 'close')
+
+    def frame(self, ticker):
+        """1銘柄分を load_stock_data() と同じ形（float64 の価格, int64 の volume, datetime64 の索引）に戻す。"""
+        span = self.ticker_slice(ticker)
+        index = pd.DatetimeIndex(self.dates[span].astype('datetime64[s]').astype('datetime64[us]'), name='date')
+        data = {name: (values[span].astype(np.int64) if name == 'volume' else unscale_prices(values[span]))
+                for name, values in self.columns.items()}
+        return pd.DataFrame(data, index=index)
@@ -0,0 +1,55 @@
+'''indicators.py'''
+
+class MovingAverage:
+    """直近 window 本の単純移動平均を累積和で保持する。
+
+    update() は定数時間で、リングバッファは生成時に確保したものを使い回す。
+    誤差の蓄積を防ぐため、バッファが一周するたびに合計を計算し直す。
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.buffer = [0.0] * window
+        self.position = 0
+        self.count = 0
+        self.total = 0.0
+
+    def update(self, price):
+        if self.count < self.window:
+            self.count += 1
+        else:
+            self.total -= self.buffer[self.position]
+        self.buffer[self.position] = price
+        self.total += price
+        self.position += 1
+        if self.position == self.window:
+            self.position = 0
+            self.total = sum(self.buffer)
+
+    @property
+    def ready(self):
+        return self.count >= self.window
+
+    @property
+    def value(self):
+        if not self.ready:
+            return None
+        return self.total / self.window
+
+
+class MovingAverages:
+    """短期・長期の移動平均の組。TradeController と determine_trend で使う。"""
+
+    def __init__(self, short_window, long_window, prices=()):
+        self.short = MovingAverage(short_window)
+        self.long = MovingAverage(long_window)
+        for price in prices:
+            self.update(price)
+
+    def update(self, price):
+        self.short.update(price)
+        self.long.update(price)
+
+    @property
+    def ready(self):
+        return self.short.ready and self.long.ready
@@ -1,12 +1,128 @@
 '''logging_setup.py'''
 import os
+import gzip
+import queue
+import atexit
+import shutil
 import datetime
 import logging
+import logging.handlers
+import contextvars
+import multiprocessing.util
+from collections import OrderedDict
+
+log_dir_name = "optimal_parameter_log"
+# start_logging() で指定しなかったときのログレベル
+log_level = logging.INFO
+# ファイルが max_log_bytes を超えたら .1.gz, .2.gz ... に圧縮して log_backup_count 世代残す
+max_log_bytes = 10 * 1024 * 1024
+log_backup_count = 5
+# 同時に開いておく銘柄別ログファイルの上限（古いものから閉じる）
+max_open_files = 32
+
+_listener = None
+_queue_handler = None
+_listener_pid = None
+# setup_logging() で切り替えた銘柄別のログファイル（Flask のリクエストのスレッドごとに別の値になる）
+_current_filename = contextvars.ContextVar('log_filename', default=None)
+
+def _gzip_namer(name):
+    return name + '.gz'
+
+def _gzip_rotator(source, dest):
+    with open(source, 'rb') as f_in, gzip.open(dest, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+def rotating_file_handler(filename):
+    handler = logging.handlers.RotatingFileHandler(filename, maxBytes=max_log_bytes, backupCount=log_backup_count, encoding='utf-8', delay=True)
+    handler.namer = _gzip_namer
+    handler.rotator = _gzip_rotator
+    handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+    return handler
+
+class TickerRoutingHandler(logging.Handler):
+    """record.log_filename のファイルに書き込む（QueueListener のスレッドで動く）。指定がなければ default_filename。"""
+
+    def __init__(self, default_filename):
+        super().__init__()
+        self.default_filename = default_filename
+        self.handlers = OrderedDict()
+
+    def emit(self, record):
+        filename = getattr(record, 'log_filename', None) or self.default_filename
+        handler = self.handlers.get(filename)
+        if handler is None:
+            handler = self.handlers[filename] = rotating_file_handler(filename)
+            if len(self.handlers) > max_open_files:
+                self.handlers.popitem(last=False)[1].close()
+        else:
+            self.handlers.move_to_end(filename)
+        handler.handle(record)
+
+    def close(self):
+        for handler in self.handlers.values():
+            handler.close()
+        self.handlers.clear()
+        super().close()
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """メッセージの整形をリスナーのスレッドに任せる QueueHandler。
+
+    標準の QueueHandler は呼び出し元で整形してからキューに入れる。ログの引数は数値や文字列だけなので、
+    整形を後回しにしても内容は変わらない。例外のトレースバックだけは呼び出し元で整形する。
+    """
+
+    def prepare(self, record):
+        if record.exc_info or record.stack_info:
+            record = super().prepare(record)
+        record.log_filename = _current_filename.get()
+        return record
+
+def start_logging(level=None, log_dir=None):
+    """ルートロガーにキュー経由の非同期ハンドラを設定する（同じプロセスで2回目以降はレベルの変更だけ）。"""
+    global _listener, _queue_handler, _listener_pid
+    root = logging.getLogger()
+    if _listener is not None and _listener_pid == os.getpid():
+        if level is not None:
+            root.setLevel(level)
+        return
+    if level is not None:
+        root.setLevel(level)
+    elif _listener_pid is None:
+        root.setLevel(log_level)  # fork した子プロセスは親のレベルを引き継ぐ
+    if _queue_handler is not None:
+        # fork で親から引き継いだハンドラ（親のリスナーのスレッドは子プロセスでは動いていない）
+        root.removeHandler(_queue_handler)
+
+    log_dir = log_dir or os.path.abspath(log_dir_name)
+    os.makedirs(log_dir, exist_ok=True)
+    log_queue = queue.SimpleQueue()
+    _queue_handler = LazyQueueHandler(log_queue)
+    _listener = logging.handlers.QueueListener(log_queue, TickerRoutingHandler(os.path.join(log_dir, 'optimal_parameter.log')))
+    _listener_pid = os.getpid()
+    root.addHandler(_queue_handler)
+    _listener.start()
+    # 終了時にキューに残ったログを書き出す（プロセスプールのワーカーは atexit が呼ばれないので Finalize も登録する）
+    atexit.register(stop_logging)
+    multiprocessing.util.Finalize(None, stop_logging, exitpriority=10)
+
+def stop_logging():
+    global _listener
+    if _listener is None or _listener_pid != os.getpid():
+        return
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    logging.getLogger().removeHandler(_queue_handler)
+    _listener = None
 
 def setup_logging(symbol):
-    log_dir = os.path.abspath("optimal_parameter_log")
+    """以降のログを銘柄ごとのファイルに書き込むように切り替え、ログのディレクトリを返す。"""
+    log_dir = os.path.abspath(log_dir_name)
     os.makedirs(log_dir, exist_ok=True)
     results_date_str = datetime.datetime.now().strftime('%Y%m%d%H%M')
     log_filename = os.path.join(log_dir, f'{symbol.replace(".", "_")}_optimal_parameter_{results_date_str}.log')
-    logging.basicConfig(filename=log_filename, level=logging.INFO)
+    start_logging(log_dir=log_dir)
+    _current_filename.set(log_filename)
     return log_dir
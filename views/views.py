@@ -1,5 +1,59 @@
 import logging
+import logging.handlers
 import os
+import gzip
+import queue
+import atexit
+import shutil
+
+# ファイルが max_log_bytes を超えたら .1.gz, .2.gz ... に圧縮して log_backup_count 世代残す
+max_log_bytes = 10 * 1024 * 1024
+log_backup_count = 5
+
+_listener = None
+
+def _gzip_namer(name):
+    return name + '.gz'
+
+def _gzip_rotator(source, dest):
+    with open(source, 'rb') as f_in, gzip.open(dest, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    # 整形はリスナーのスレッドで行う（例外のトレースバックだけは呼び出し元で整形する）
+    def prepare(self, record):
+        if record.exc_info or record.stack_info:
+            return super().prepare(record)
+        return record
+
+def setup_async_logging(log_filename, level=logging.INFO):
+    """ルートロガーの出力をキュー経由で別スレッドから log_filename に書き込む（2回目以降は何もしない）。"""
+    global _listener
+    if _listener is not None:
+        return
+    file_handler = logging.handlers.RotatingFileHandler(log_filename, maxBytes=max_log_bytes, backupCount=log_backup_count, encoding='utf-8', delay=True)
+    file_handler.namer = _gzip_namer
+    file_handler.rotator = _gzip_rotator
+    file_handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(log_queue, file_handler)
+    root = logging.getLogger()
+    root.addHandler(LazyQueueHandler(log_queue))
+    root.setLevel(level)
+    _listener.start()
+    atexit.register(stop_async_logging)
+
+def stop_async_logging():
+    # キューに残ったログを書き出してからファイルを閉じる
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
 
 class Logger:
     def __init__(self, log_dir='logs/trade_logs', log_filename='auto_trade.log'):
@@ -10,12 +64,12 @@ class Logger:
     def setup_logger(self):
         if not os.path.exists(self.log_dir):
             os.makedirs(self.log_dir)
-        logging.basicConfig(filename=os.path.join(self.log_dir, self.log_filename), level=logging.INFO)
+        setup_async_logging(os.path.join(self.log_dir, self.log_filename))
 
     @staticmethod
-    def info(message):
-        logging.info(message)
+    def info(message, *args):
+        logging.info(message, *args)
 
     @staticmethod
-    def error(message):
-        logging.error(message)
+    def error(message, *args):
+        logging.error(message, *args)